@@ -0,0 +1,105 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .versions import bump_on_commit, get_version, is_shared
+
+AUTH_VERSION = 'auth:{}'
+
+
+class TokenCache:
+    """Ограниченный по размеру кеш токенов в памяти процесса:
+    устаревшие записи вытесняются по сроку и по давности обращения."""
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.timeout, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE,
+                         settings.TOKEN_CACHE_TIMEOUT)
+
+
+def get_auth_version_name(key):
+    # в общем кеше хранится хеш токена, а не сам токен.
+    return AUTH_VERSION.format(hashlib.sha1(key.encode()).hexdigest())
+
+
+def get_auth_version(key):
+    return get_version(get_auth_version_name(key))
+
+
+def invalidate_token(key):
+    """Отзывает кешированный токен во всех процессах, которые используют
+    общий кеш версий, после фиксации транзакции."""
+    token_cache.pop(key)
+    bump_on_commit(get_auth_version_name(key))
+
+
+def invalidate_users(user_ids):
+    """Отзывает кешированные токены пользователей user_ids."""
+    tokens = Token.objects.filter(user_id__in=user_ids)
+    for key in tokens.values_list('key', flat=True):
+        invalidate_token(key)
+
+
+def is_cache_enabled():
+    """Токены кешируются, только если версии пользователей лежат в общем
+    кеше: иначе выход или блокировка в одном процессе gunicorn не отзовёт
+    токен в остальных."""
+    return settings.TOKEN_CACHE_TIMEOUT > 0 and is_shared()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе на каждый запрос.
+    Пара (пользователь, токен) хранится в памяти процесса и сверяется
+    с версией токена в кеше, которая меняется при выходе, смене пароля
+    и любом изменении пользователя."""
+    def authenticate_credentials(self, key):
+        if not is_cache_enabled():
+            return super().authenticate_credentials(key)
+        # версия читается до запроса к базе: выход, зафиксированный
+        # между запросом и чтением, иначе остался бы незамеченным.
+        version = get_auth_version(key)
+        cached = token_cache.get(key)
+        if cached is not None and cached[2] == version:
+            user, token, version = cached
+            # запрос может изменить пользователя, общий объект — нет.
+            return copy.deepcopy(user), token
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (copy.deepcopy(user), token, version))
+        return user, token
@@ -0,0 +1,155 @@
+import pickle
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+DEFAULT_CLIENT_CLASS = 'redis.Redis'
+
+
+class RedisCache(BaseCache):
+    """Бэкенд кеша поверх клиента с интерфейсом redis-py
+    (get/set с ex и nx, delete, incr, exists, flushdb).
+    Класс клиента задаётся в OPTIONS['CLIENT_CLASS'] и создаётся
+    через from_url(LOCATION): redis.Redis или FakeRedis для разработки."""
+    def __init__(self, server, params):
+        super().__init__(params)
+        self._server = server
+        options = params.get('OPTIONS', {})
+        self._client_class = options.get('CLIENT_CLASS', DEFAULT_CLIENT_CLASS)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = import_string(self._client_class).from_url(
+                self._server)
+        return self._client
+
+    def get_expiry(self, timeout):
+        """Срок жизни в секундах для redis: None — без срока."""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else max(int(timeout), 0)
+
+    @staticmethod
+    def encode(value):
+        # целые числа хранятся как есть, чтобы работал INCR.
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def decode(value):
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def make_checked_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self.get_expiry(timeout)
+        if expiry == 0:
+            return False
+        return bool(self.client.set(
+            self.make_checked_key(key, version), self.encode(value),
+            ex=expiry, nx=True))
+
+    def get(self, key, default=None, version=None):
+        value = self.client.get(self.make_checked_key(key, version))
+        return default if value is None else self.decode(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_checked_key(key, version)
+        expiry = self.get_expiry(timeout)
+        if expiry == 0:
+            self.client.delete(key)
+        else:
+            self.client.set(key, self.encode(value), ex=expiry)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self.get(key, version=version)
+        if value is None:
+            return False
+        self.set(key, value, timeout, version)
+        return True
+
+    def delete(self, key, version=None):
+        self.client.delete(self.make_checked_key(key, version))
+
+    def has_key(self, key, version=None):
+        return bool(self.client.exists(self.make_checked_key(key, version)))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_checked_key(key, version)
+        if not self.client.exists(key):
+            raise ValueError(f"Key '{key}' not found")
+        return self.client.incr(key, delta)
+
+    def clear(self):
+        self.client.flushdb()
+
+
+class FakeRedis:
+    """Клиент redis в памяти процесса с тем же подмножеством команд.
+    Клиенты с одинаковым адресом разделяют данные."""
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        with cls._instances_lock:
+            if url not in cls._instances:
+                cls._instances[url] = cls()
+            return cls._instances[url]
+
+    def _get_alive(self, name):
+        item = self._data.get(name)
+        if item is None or item[1] is None or item[1] > time.monotonic():
+            return item
+        del self._data[name]
+        return None
+
+    def get(self, name):
+        with self._lock:
+            item = self._get_alive(name)
+            return None if item is None else item[0]
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._get_alive(name) is not None:
+                return None
+            expires = None if ex is None else time.monotonic() + ex
+            self._data[name] = (bytes(value), expires)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None
+                       for name in names)
+
+    def exists(self, *names):
+        with self._lock:
+            return sum(self._get_alive(name) is not None for name in names)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            item = self._get_alive(name)
+            value, expires = item if item is not None else (b'0', None)
+            value = int(value) + amount
+            self._data[name] = (str(value).encode(), expires)
+            return value
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
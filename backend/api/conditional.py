@@ -0,0 +1,137 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.response import Response
+
+from recipes.models import Recipe
+
+from . import response_cache
+from .ingredient_index import VERSION_NAME as INGREDIENTS_VERSION
+from .tag_cache import VERSION_NAME as TAGS_VERSION
+from .versions import get_version
+
+USERS_VERSION = 'users'
+# рецепты, их ингредиенты, теги и готовность копий картинок.
+RECIPES_VERSION = 'recipes'
+USER_STATE_VERSION = 'user-state:{}'
+SHOPPING_LIST_VERSION = 'shopping-list:{}'
+# пересборка списков покупок всех пользователей.
+SHOPPING_LISTS_VERSION = 'shopping-lists'
+
+
+def make_etag(*parts):
+    return f'"{hashlib.sha1(repr(parts).encode()).hexdigest()}"'
+
+
+def get_user_state_version(user):
+    """Версия избранного, корзины и подписок пользователя:
+    от них зависят признаки is_favorited, is_in_shopping_cart
+    и is_subscribed в ответах."""
+    if user.is_anonymous:
+        return None
+    return get_version(USER_STATE_VERSION.format(user.id))
+
+
+def get_recipes_etag(request):
+    """ETag списков рецептов из версий данных, без запросов к базе:
+    любое изменение рецептов меняет ETag всех списков."""
+    return make_etag(
+        'recipes', get_version(RECIPES_VERSION),
+        get_version(INGREDIENTS_VERSION), get_version(TAGS_VERSION),
+        get_version(USERS_VERSION), get_user_state_version(request.user)
+    )
+
+
+def get_recipe_etag(request, pk):
+    """ETag одного рецепта или None, если его нет."""
+    row = Recipe.objects.filter(pk=pk).values_list(
+        'pub_date', 'image_derivatives_ready').first()
+    if row is None:
+        return None
+    return make_etag(
+        'recipe', pk, *row, get_version(INGREDIENTS_VERSION),
+        get_version(TAGS_VERSION), get_version(USERS_VERSION),
+        get_user_state_version(request.user)
+    )
+
+
+def get_shopping_list_etag(request, export_format):
+    """ETag выгрузки списка покупок из версий данных, без запросов
+    к базе: список меняют корзина, состав рецептов в ней и названия
+    ингредиентов."""
+    return make_etag(
+        'shopping_list', export_format,
+        get_version(SHOPPING_LIST_VERSION.format(request.user.id)),
+        get_version(SHOPPING_LISTS_VERSION), get_version(INGREDIENTS_VERSION)
+    )
+
+
+def get_users_etag(request):
+    return make_etag('users', get_version(USERS_VERSION),
+                     get_user_state_version(request.user))
+
+
+def get_catalog_etag(version_name):
+    return make_etag(version_name, get_version(version_name))
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 Not Modified до сериализации, если ETag ресурса
+    совпал с заголовком If-None-Match. Вьюсет возвращает ETag из
+    get_list_etag и get_object_etag. Last-Modified не отдаётся: дата
+    рецептов не меняется при удалениях и при изменении тегов, авторов
+    и ингредиентов, которые учитывает ETag. С cache_anonymous ответы
+    анонимным клиентам берутся из кеша ответов (api.response_cache)."""
+    cache_anonymous = False
+
+    def get_list_etag(self, request):
+        return None
+
+    def get_object_etag(self, request):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_response(super().list, self.get_list_etag,
+                                 request, args, kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_response(super().retrieve, self.get_object_etag,
+                                 request, args, kwargs)
+
+    def get_response(self, handler, get_etag, request, args, kwargs):
+        """Анонимным клиентам при cache_anonymous отдаёт данные ответа
+        и его ETag из кеша ответов."""
+        if not (self.cache_anonymous and request.user.is_anonymous):
+            return self.conditional_response(
+                lambda: handler(request, *args, **kwargs), get_etag(request)
+            )
+
+        def build():
+            etag = get_etag(request)
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response, None
+            return response, {'data': response.data, 'etag': etag}
+
+        response, entry = response_cache.get_or_build(request, build)
+        if entry is None:
+            return response
+        return self.conditional_response(
+            lambda: (response if response is not None
+                     else Response(entry['data'])),
+            entry['etag']
+        )
+
+    def conditional_response(self, respond, etag=None):
+        request = self.request
+        response = None
+        if etag:
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = respond()
+            if response.status_code != 200:
+                return response
+        if etag:
+            response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+        return response
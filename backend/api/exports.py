@@ -0,0 +1,105 @@
+import csv
+import os
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from reportlab.pdfbase import pdfmetrics, ttfonts
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+FONT_NAME = 'Arial'
+FONT_FILE = os.path.join(settings.BASE_DIR, 'data', 'arial.ttf')
+FONT_SIZE = 14
+COORDINATE_X = 100
+COORDINATE_X_LIST = 80
+COORDINATE_Y = 750
+HEIGHT = 700
+HEIGHT_STEP = 25
+BOTTOM_MARGIN = 50
+# файл держится в памяти, пока не превысит этот размер, затем на диске.
+SPOOL_MAX_SIZE = 1024 * 1024
+TITLE = 'Список покупок'
+CSV_HEADER = ('Название', 'Единица измерения', 'Количество')
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрирует шрифт один раз на процесс."""
+    pdfmetrics.registerFont(ttfonts.TTFont(FONT_NAME, FONT_FILE))
+    return FONT_NAME
+
+
+def get_shopping_list(user):
+    """Возвращает сводный список покупок пользователя
+    в виде кортежей (название, единица измерения, количество)."""
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def render_pdf(ingredients):
+    """Рисует список покупок постранично и возвращает файл с PDF,
+    установленный на начало."""
+    font = register_font()
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    pdf = canvas.Canvas(output)
+    pdf.setFont(font, FONT_SIZE)
+    pdf.drawString(COORDINATE_X, COORDINATE_Y, TITLE)
+    height = HEIGHT
+    for i, (name, unit, amount) in enumerate(ingredients, start=1):
+        if height < BOTTOM_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, FONT_SIZE)
+            height = COORDINATE_Y
+        pdf.drawString(
+            COORDINATE_X_LIST, height,
+            f'{i}. {name} – {amount} {unit}')
+        height -= HEIGHT_STEP
+    pdf.showPage()
+    pdf.save()
+    output.seek(0)
+    return output
+
+
+def iter_text(ingredients):
+    """Построчно отдаёт список покупок в виде текста."""
+    yield f'{TITLE}\n\n'
+    for i, (name, unit, amount) in enumerate(ingredients, start=1):
+        yield f'{i}. {name} – {amount} {unit}\n'
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(ingredients):
+    """Построчно отдаёт список покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for name, unit, amount in ingredients:
+        yield writer.writerow((name, unit, amount))
+
+
+def export_shopping_list(ingredients, export_format):
+    """Возвращает ответ со списком покупок в формате txt, csv или pdf.
+    Текст и CSV генерируются построчно, PDF отдаётся из временного
+    файла частями: ни один формат не собирается в памяти целиком."""
+    if export_format == 'pdf':
+        response = FileResponse(render_pdf(ingredients),
+                                content_type='application/pdf')
+    else:
+        iterate, content_type = {
+            'txt': (iter_text, 'text/plain; charset=utf-8'),
+            'csv': (iter_csv, 'text/csv; charset=utf-8'),
+        }[export_format]
+        response = StreamingHttpResponse(iterate(ingredients),
+                                         content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_cart.{export_format}"'
+    )
+    return response
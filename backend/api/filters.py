@@ -1,8 +1,12 @@
-from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.db.models import Case, IntegerField, When
 from django_filters.rest_framework import FilterSet, filters
 
+from recipes import search
 from recipes.models import Ingredient, Recipe
 
+from .ingredient_index import ingredient_index
+from .tag_cache import get_tag_choices
+
 
 class IngredientFilter(FilterSet):
     """Фильтр ингредиентов по названию"""
@@ -13,34 +17,40 @@ class IngredientFilter(FilterSet):
         fields = ('name',)
 
     def filter_name(self, queryset, name, value):
-        """Метод возвращает заданное имя ингредиента."""
-        return queryset.filter(
-            Q(name__istartswith=value) | Q(name__icontains=value)
-        ).annotate(
-            startswith=ExpressionWrapper(
-                Q(name__istartswith=value),
-                output_field=BooleanField()
-            )
-        ).order_by('-startswith')
+        """Метод возвращает ингредиенты из индекса в памяти:
+        сначала начинающиеся с заданного имени, затем содержащие его."""
+        ids = [item['id'] for item in ingredient_index.search(value)]
+        return queryset.filter(id__in=ids).order_by(Case(
+            *(When(id=id, then=position) for position, id in enumerate(ids)),
+            output_field=IntegerField()
+        ))
 
 
 class RecipeFilter(FilterSet):
-    """Фильтр рецептов по автору/тегу/подписке/наличию в списке покупок"""
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    """Фильтр рецептов по автору/тегу/подписке/наличию в списке покупок
+    и полнотекстовый поиск с сортировкой по релевантности"""
+    search = filters.CharFilter(method='filter_search')
+    tags = filters.MultipleChoiceFilter(field_name='tags__slug',
+                                        choices=get_tag_choices)
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
+
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
 
     def filter_is_favorited(self, queryset, name, value):
+        # queryset уже аннотирован в RecipeViewSet.get_queryset.
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_carts__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
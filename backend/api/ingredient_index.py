@@ -0,0 +1,90 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+from .versions import get_version
+
+VERSION_NAME = 'ingredients'
+NGRAM_SIZE = 3
+SEARCH_LIMIT = 50
+
+
+def get_ngrams(value):
+    return {value[i:i + NGRAM_SIZE]
+            for i in range(len(value) - NGRAM_SIZE + 1)}
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+    Отсортированные названия в нижнем регистре дают поиск по началу
+    строки, индекс n-грамм — поиск по подстроке. Индекс строится при
+    первом обращении и перестраивается при смене версии ингредиентов."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._snapshot = None
+
+    def invalidate(self):
+        self._version = None
+
+    def _build(self):
+        items = sorted(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+            key=lambda item: (item[1].casefold(), item[0])
+        )
+        keys = [name.casefold() for _, name, _ in items]
+        ngrams = {}
+        for position, key in enumerate(keys):
+            for ngram in get_ngrams(key):
+                ngrams.setdefault(ngram, []).append(position)
+        return items, keys, ngrams
+
+    def _get_snapshot(self):
+        version = get_version(VERSION_NAME)
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._snapshot = self._build()
+                    self._version = version
+        return self._snapshot
+
+    @staticmethod
+    def _find_containing(query, keys, ngrams):
+        """Позиции названий, содержащих query, в алфавитном порядке."""
+        if len(query) < NGRAM_SIZE:
+            return (position for position, key in enumerate(keys)
+                    if query in key)
+        postings = sorted(
+            (ngrams.get(ngram, ()) for ngram in get_ngrams(query)),
+            key=len
+        )
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return (position for position in sorted(candidates)
+                if query in keys[position])
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Возвращает до limit ингредиентов: сначала начинающиеся
+        с query, затем содержащие query, каждая группа по алфавиту."""
+        items, keys, ngrams = self._get_snapshot()
+        query = query.casefold()
+        found = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(found) < limit
+               and keys[position].startswith(query)):
+            found.append(position)
+            position += 1
+        if len(found) < limit:
+            for position in self._find_containing(query, keys, ngrams):
+                if not keys[position].startswith(query):
+                    found.append(position)
+                    if len(found) == limit:
+                        break
+        return [
+            {'id': items[position][0], 'name': items[position][1],
+             'measurement_unit': items[position][2]}
+            for position in found
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,497 @@
+import base64
+import io
+import json
+import math
+import os
+import tempfile
+import time
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request as APIRequest
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIRequestFactory
+
+from api import response_cache
+from api.serializers import GetRecipeSerializer, RecipeInfoSerializer
+from recipes import shopping_list
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.tasks import defer_tasks, run_tasks
+from users.models import Follow, User
+
+BASELINE_FILE = os.path.join(settings.BASE_DIR, 'data',
+                             'benchmark_baseline.json')
+SEED_OPTIONS = {
+    'users': 30, 'recipes': 200, 'follows_per_user': 8,
+    'favorites_per_user': 12, 'cart_per_user': 6, 'seed': 42,
+}
+PASSWORD = 'Bench-password-42'
+BULK_RECIPES = 20
+FAST_HASHER = 'django.contrib.auth.hashers.MD5PasswordHasher'
+# размеры страниц для сравнения сериализации списков рецептов.
+SERIALIZER_PAGES = (6, 50, 200)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+def get_image():
+    content = io.BytesIO()
+    Image.new('RGB', (64, 64), '#49b64e').save(content, 'PNG')
+    encoded = base64.b64encode(content.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class Request:
+    """Описание одного измеряемого запроса сценария."""
+    def __init__(self, method, path, data=None, token=None,
+                 expect=200, cleanup=None):
+        self.method = method
+        self.path = path
+        self.data = data
+        self.token = token
+        self.expect = expect
+        self.cleanup = cleanup
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет эндпоинты api/urls.py на синтетических данных '
+            'в отдельной тестовой базе, считает запросы к БД и время '
+            'ответа (p50/p95) и сравнивает с базовой линией. '
+            'Без PostgreSQL: DB_ENGINE=django.db.backends.sqlite3.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=15)
+        parser.add_argument('--baseline', default=BASELINE_FILE)
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Записать результаты как базовую линию.')
+        parser.add_argument('--time-tolerance', type=float, default=None,
+                            help='Падать, если p95 больше базового '
+                                 'в указанное число раз.')
+        parser.add_argument('--only', nargs='*', default=None,
+                            help='Запустить только указанные сценарии '
+                                 '(serializers — сравнение сериализации).')
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp(prefix='foodgram-benchmark-')
+        with override_settings(
+            MIGRATION_MODULES={
+                app.label: None for app in apps.get_app_configs()
+            },
+            PASSWORD_HASHERS=[FAST_HASHER],
+            MEDIA_ROOT=media_root,
+            # фоновые задачи выполняются в том же потоке и той же базе:
+            # задачи замеряемого запроса — после замера, отдельно.
+            BACKGROUND_WORKERS=0,
+            # общий для процессов кеш версий, как у нескольких процессов
+            # gunicorn: с ним включается кеш токенов.
+            CACHES={
+                **settings.CACHES,
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.'
+                               'FileBasedCache',
+                    'LOCATION': os.path.join(media_root, 'cache'),
+                },
+            },
+        ):
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+            try:
+                cache.clear()
+                response_cache.get_cache().clear()
+                results = self.run_benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+        self.report_serializers()
+        self.report(results, options)
+
+    def prepare_data(self):
+        call_command('load_data', stdout=io.StringIO())
+        call_command('seed_data', stdout=io.StringIO(), **SEED_OPTIONS)
+        users = list(User.objects.order_by('id'))
+        for user in users:
+            user.set_password(PASSWORD)
+        User.objects.bulk_update(users, ('password',))
+        self.user = users[0]
+        self.token = Token.objects.create(user=self.user).key
+        self.stranger = User.objects.exclude(
+            following__user=self.user).exclude(id=self.user.id).first()
+        self.author = User.objects.filter(following__user=self.user).first()
+        self.recipe = Recipe.objects.exclude(
+            favorites__user=self.user).exclude(
+            shopping_carts__user=self.user).first()
+        self.own_recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт для бенчмарка', text='Текст',
+            image='recipes/seed.png', cooking_time=10)
+        self.bulk_recipes = list(Recipe.objects.exclude(
+            favorites__user=self.user).exclude(
+            shopping_carts__user=self.user).values_list(
+            'id', flat=True)[1:BULK_RECIPES + 1])
+        self.ingredients = list(
+            Ingredient.objects.values_list('id', flat=True)[:10])
+        self.tags = list(Tag.objects.values_list('id', flat=True))
+        self.image = get_image()
+
+    def recipe_payload(self, name):
+        return {
+            'name': name, 'text': 'Описание', 'cooking_time': 15,
+            'image': self.image, 'tags': self.tags[:2],
+            'ingredients': [{'id': ingredient, 'amount': 10}
+                            for ingredient in self.ingredients],
+        }
+
+    def get(self, path, auth=True):
+        return lambda i: Request('get', path,
+                                 token=self.token if auth else None)
+
+    def delete_favorite(self, model):
+        def prepare(i):
+            model.objects.get_or_create(user=self.user, recipe=self.recipe)
+            return Request('delete', f'/api/recipes/{self.recipe.id}/'
+                           f'{self.action_name(model)}/',
+                           token=self.token, expect=204)
+        return prepare
+
+    def post_favorite(self, model):
+        def prepare(i):
+            entries = model.objects.filter(user=self.user,
+                                           recipe=self.recipe)
+            entries.delete()
+            return Request('post', f'/api/recipes/{self.recipe.id}/'
+                           f'{self.action_name(model)}/',
+                           token=self.token, expect=201,
+                           cleanup=lambda response: entries.delete())
+        return prepare
+
+    def bulk_favorite(self, model, method):
+        def prepare(i):
+            entries = model.objects.filter(user=self.user,
+                                           recipe_id__in=self.bulk_recipes)
+            entries.delete()
+            if method == 'delete':
+                for recipe in self.bulk_recipes:
+                    model.objects.create(user=self.user, recipe_id=recipe)
+            return Request(method,
+                           f'/api/recipes/{self.action_name(model)}/',
+                           data={'recipes': self.bulk_recipes},
+                           token=self.token,
+                           cleanup=lambda response: entries.delete())
+        return prepare
+
+    def prepare_user_create(self, i):
+        email = f'new{i}@example.com'
+        return Request(
+            'post', '/api/users/', expect=201,
+            data={'email': email, 'username': f'new{i}',
+                  'first_name': 'Имя', 'last_name': 'Фамилия',
+                  'password': PASSWORD},
+            cleanup=lambda response: User.objects.filter(
+                email=email).delete())
+
+    def prepare_set_password(self, i):
+        return Request('post', '/api/users/set_password/', token=self.token,
+                       expect=204, data={'current_password': PASSWORD,
+                                         'new_password': PASSWORD})
+
+    def prepare_subscribe(self, i):
+        follows = Follow.objects.filter(user=self.user, author=self.stranger)
+        follows.delete()
+        return Request('post', f'/api/users/{self.stranger.id}/subscribe/',
+                       token=self.token, expect=201,
+                       cleanup=lambda response: follows.delete())
+
+    def prepare_unsubscribe(self, i):
+        Follow.objects.get_or_create(user=self.user, author=self.stranger)
+        return Request('delete', f'/api/users/{self.stranger.id}/subscribe/',
+                       token=self.token, expect=204)
+
+    def prepare_login(self, i):
+        tokens = Token.objects.filter(user=self.user).exclude(key=self.token)
+        return Request('post', '/api/auth/token/login/',
+                       data={'email': self.user.email, 'password': PASSWORD},
+                       cleanup=lambda response: tokens.delete())
+
+    def prepare_logout(self, i):
+        user = User.objects.create_user(
+            email=f'logout{i}@example.com', username=f'logout{i}',
+            first_name='Имя', last_name='Фамилия', password=PASSWORD)
+        return Request('post', '/api/auth/token/logout/', expect=204,
+                       token=Token.objects.create(user=user).key)
+
+    def prepare_recipe_create(self, i):
+        return Request(
+            'post', '/api/recipes/', expect=201, token=self.token,
+            data=self.recipe_payload(f'Новый рецепт {i}'),
+            cleanup=lambda response: Recipe.objects.filter(
+                id=response.json()['id']).delete())
+
+    def prepare_recipe_update(self, i):
+        return Request('patch', f'/api/recipes/{self.own_recipe.id}/',
+                       data=self.recipe_payload(f'Изменённый рецепт {i}'),
+                       token=self.token)
+
+    def prepare_recipe_delete(self, i):
+        """Удаляемый рецепт с ингредиентами лежит в корзине автора."""
+        recipe = Recipe.objects.create(
+            author=self.user, name=f'Удаляемый {i}', text='Текст',
+            image='recipes/seed.png', cooking_time=5)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient,
+                             amount=10)
+            for ingredient in self.ingredients)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        shopping_list.add_recipe(self.user, recipe)
+        return Request('delete', f'/api/recipes/{recipe.id}/',
+                       token=self.token, expect=204)
+
+    def get_scenarios(self):
+        """Возвращает сценарии: имя и функцию, строящую запрос
+        для номера итерации."""
+        get = self.get
+        recipe, author = self.recipe, self.author
+        tag = Tag.objects.filter(recipes__isnull=False).first()
+        return [
+            ('users_list_anon', get('/api/users/', auth=False)),
+            ('users_list', get('/api/users/')),
+            ('user_detail', get(f'/api/users/{author.id}/')),
+            ('users_me', get('/api/users/me/')),
+            ('user_create', self.prepare_user_create),
+            ('set_password', self.prepare_set_password),
+            ('subscriptions',
+             get('/api/users/subscriptions/?recipes_limit=3')),
+            ('subscribe', self.prepare_subscribe),
+            ('unsubscribe', self.prepare_unsubscribe),
+            ('token_login', self.prepare_login),
+            ('token_logout', self.prepare_logout),
+            ('tags_list', get('/api/tags/', auth=False)),
+            ('tag_detail', get(f'/api/tags/{tag.id}/', auth=False)),
+            ('ingredients_list', get('/api/ingredients/', auth=False)),
+            ('ingredients_search',
+             get('/api/ingredients/?name=мол', auth=False)),
+            ('ingredient_detail', get(
+                f'/api/ingredients/{self.ingredients[0]}/', auth=False)),
+            ('recipes_list_anon', get('/api/recipes/', auth=False)),
+            ('recipes_list', get('/api/recipes/')),
+            ('recipes_list_large', get('/api/recipes/?limit=50')),
+            ('recipes_list_deep', get('/api/recipes/?page=5')),
+            ('recipes_list_cursor', get('/api/recipes/?cursor=')),
+            ('recipes_filtered', get(
+                f'/api/recipes/?tags={tag.slug}&is_favorited=1')),
+            ('recipes_cart', get('/api/recipes/?is_in_shopping_cart=1')),
+            ('recipes_search', get('/api/recipes/?search=рецепт 1')),
+            ('recipes_author', get(f'/api/recipes/?author={author.id}')),
+            ('recipes_feed', get('/api/recipes/feed/')),
+            ('recipe_detail', get(f'/api/recipes/{recipe.id}/')),
+            ('recipe_similar', get(f'/api/recipes/{recipe.id}/similar/')),
+            ('recipe_create', self.prepare_recipe_create),
+            ('recipe_update', self.prepare_recipe_update),
+            ('recipe_delete', self.prepare_recipe_delete),
+            ('favorite_add', self.post_favorite(Favorite)),
+            ('favorite_remove', self.delete_favorite(Favorite)),
+            ('shopping_cart_add', self.post_favorite(ShoppingCart)),
+            ('shopping_cart_remove', self.delete_favorite(ShoppingCart)),
+            ('favorite_bulk_add', self.bulk_favorite(Favorite, 'post')),
+            ('favorite_bulk_remove',
+             self.bulk_favorite(Favorite, 'delete')),
+            ('shopping_cart_bulk_add',
+             self.bulk_favorite(ShoppingCart, 'post')),
+            ('shopping_cart_bulk_remove',
+             self.bulk_favorite(ShoppingCart, 'delete')),
+            ('download_shopping_cart',
+             get('/api/recipes/download_shopping_cart/')),
+            ('download_shopping_cart_txt',
+             get('/api/recipes/download_shopping_cart/?format=txt')),
+            ('download_shopping_cart_csv',
+             get('/api/recipes/download_shopping_cart/?format=csv')),
+        ]
+
+    @staticmethod
+    def action_name(model):
+        return 'favorite' if model is Favorite else 'shopping_cart'
+
+    def measure(self, client, request):
+        headers = {}
+        if request.token:
+            headers['HTTP_AUTHORIZATION'] = f'Token {request.token}'
+        kwargs = {}
+        if request.data is not None:
+            kwargs = {'data': json.dumps(request.data),
+                      'content_type': 'application/json'}
+        method = getattr(client, request.method)
+        with defer_tasks() as tasks, \
+                CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = method(request.path, **kwargs, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if response.status_code != request.expect:
+            raise CommandError(
+                f'{request.method.upper()} {request.path}: ожидался '
+                f'статус {request.expect}, получен {response.status_code}')
+        with CaptureQueriesContext(connection) as background:
+            run_tasks(tasks)
+        if request.cleanup:
+            request.cleanup(response)
+        return len(queries), len(background), elapsed * 1000
+
+    @staticmethod
+    def serialize_recipes(request, size, fast, serializer_class):
+        """Страница из size рецептов: списочным сериализатором
+        (RecipeListSerializer, RecipeInfoListSerializer) или по полям
+        serializer_class для каждого рецепта, как без него."""
+        context = {'request': request}
+        recipes = Recipe.objects.with_user_flags(request.user)
+        if fast:
+            return serializer_class(
+                recipes.select_related('author')[:size], many=True,
+                context=context).data
+        return ListSerializer(
+            recipes.with_related()[:size], child=serializer_class(),
+            context=context).data
+
+    def benchmark_serializers(self, iterations):
+        """Сверяет JSON списочных сериализаторов с выводом по полям
+        и замеряет время обоих путей для страниц SERIALIZER_PAGES."""
+        # половина рецептов — с готовыми копиями картинок.
+        Recipe.objects.filter(id__in=list(Recipe.objects.values_list(
+            'id', flat=True)[::2])).update(image_derivatives_ready=True)
+        renderer = JSONRenderer()
+        factory = APIRequestFactory()
+        self.serializer_timings = []
+        for size in SERIALIZER_PAGES:
+            timings = {}
+            for user in (AnonymousUser(), self.user):
+                for serializer_class in (GetRecipeSerializer,
+                                         RecipeInfoSerializer):
+                    rendered = [renderer.render(self.serialize_recipes(
+                        self.make_request(factory, user), size, fast,
+                        serializer_class)) for fast in (False, True)]
+                    if rendered[0] != rendered[1]:
+                        raise CommandError(
+                            f'{serializer_class.__name__}: вывод списка '
+                            f'из {size} рецептов отличается от вывода '
+                            f'по полям')
+            for fast in (False, True):
+                values = []
+                for i in range(iterations):
+                    request = self.make_request(factory, self.user)
+                    start = time.perf_counter()
+                    renderer.render(self.serialize_recipes(
+                        request, size, fast, GetRecipeSerializer))
+                    values.append((time.perf_counter() - start) * 1000)
+                timings[fast] = percentile(values, 0.5)
+            self.serializer_timings.append(
+                (size, timings[False], timings[True]))
+
+    @staticmethod
+    def make_request(factory, user):
+        request = APIRequest(factory.get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def run_benchmark(self, options):
+        self.prepare_data()
+        client = Client()
+        results = {}
+        self.serializer_timings = []
+        for name, prepare in self.get_scenarios():
+            if options['only'] and name not in options['only']:
+                continue
+            queries, background, timings = [], [], []
+            for i in range(options['iterations']):
+                count, background_count, elapsed = self.measure(
+                    client, prepare(i))
+                queries.append(count)
+                background.append(background_count)
+                timings.append(elapsed)
+            results[name] = {
+                'queries': max(queries),
+                'background_queries': max(background),
+                'p50_ms': round(percentile(timings, 0.5), 2),
+                'p95_ms': round(percentile(timings, 0.95), 2),
+            }
+        if not options['only'] or 'serializers' in options['only']:
+            self.benchmark_serializers(options['iterations'])
+        return results
+
+    def report_serializers(self):
+        if not self.serializer_timings:
+            return
+        self.stdout.write(f'{"рецептов на странице":<28}{"по полям, мс":>14}'
+                          f'{"списком, мс":>14}{"ускорение":>12}')
+        for size, slow, fast in self.serializer_timings:
+            self.stdout.write(f'{size:<28}{slow:>14.2f}{fast:>14.2f}'
+                              f'{slow / fast:>11.1f}x')
+        self.stdout.write('')
+
+    @staticmethod
+    def format_budget(result, base, key):
+        return f'{result[key]:>6} / {base.get(key, "-"):<4}'
+
+    @staticmethod
+    def get_exceeded(name, result, base):
+        """Превышения бюджетов запросов в самом запросе
+        и в его фоновых задачах."""
+        return [
+            f'{name}: {result[key]} {label} при бюджете {base[key]}'
+            for key, label in (('queries', 'запросов'),
+                               ('background_queries', 'фоновых запросов'))
+            if base.get(key) is not None and result[key] > base[key]
+        ]
+
+    def report(self, results, options):
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        failures = []
+        self.stdout.write(
+            f'{"сценарий":<28}{"запросы":>12}{"фоновые":>12}{"p50, мс":>10}'
+            f'{"p95, мс":>10}{"база p95":>10}')
+        for name, result in results.items():
+            base = baseline.get(name, {})
+            line = (f'{name:<28}'
+                    f'{self.format_budget(result, base, "queries")}'
+                    f'{self.format_budget(result, base, "background_queries")}'
+                    f'{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                    f'{base.get("p95_ms", "-"):>10}')
+            exceeded = self.get_exceeded(name, result, base)
+            if exceeded:
+                failures.extend(exceeded)
+                line = self.style.ERROR(line)
+            tolerance = options['time_tolerance']
+            if (tolerance and base.get('p95_ms')
+                    and result['p95_ms'] > base['p95_ms'] * tolerance):
+                failures.append(f'{name}: p95 {result["p95_ms"]} мс, '
+                                f'база {base["p95_ms"]} мс')
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if options['update_baseline']:
+            baseline.update(results)
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(baseline, file, ensure_ascii=False, indent=2,
+                          sort_keys=True)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'=== Базовая линия записана в {options["baseline"]} ==='))
+            return
+        if failures:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('=== Бюджеты соблюдены ==='))
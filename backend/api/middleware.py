@@ -0,0 +1,140 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('api.profiling')
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def get_query_shape(sql):
+    """Приводит SQL к виду без зависимости от длины списков IN,
+    чтобы одинаковые запросы с разными параметрами совпадали."""
+    return WHITESPACE.sub(' ', IN_LIST.sub('(%s, ...)', sql)).strip()
+
+
+class RequestProfile:
+    """Счётчик запросов к БД и замеры фаз одного HTTP-запроса."""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+        self.view_start = None
+        self.view_end = None
+        self.view_db_time = 0.0
+        self.render_start = None
+        self.render_end = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.shapes[get_query_shape(sql)] += 1
+
+    def set_view_start(self):
+        self.view_start = time.perf_counter()
+        self.view_db_time = self.db_time
+
+    def set_view_end(self):
+        if self.view_start is not None and self.view_end is None:
+            self.view_end = time.perf_counter()
+            self.view_db_time = self.db_time - self.view_db_time
+
+    def set_render_end(self, response):
+        self.render_end = time.perf_counter()
+
+    @staticmethod
+    def get_duration(start, end):
+        return end - start if start is not None and end is not None else 0.0
+
+    def get_timings(self, end):
+        """Длительность фаз в миллисекундах: БД; код вью без учёта БД,
+        куда входит и сериализация — DRF сериализует данные во вью;
+        рендеринг ответа; код middleware без учёта БД; весь запрос."""
+        total = end - self.start
+        view = self.get_duration(self.view_start, self.view_end)
+        render = self.get_duration(self.render_start, self.render_end)
+        return {
+            'db': self.db_time * 1000,
+            'view': max(view - self.view_db_time, 0.0) * 1000,
+            'render': render * 1000,
+            'middleware': max(total - view - render
+                              - (self.db_time - self.view_db_time),
+                              0.0) * 1000,
+            'total': total * 1000,
+        }
+
+    def get_repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if count >= threshold]
+
+
+class RequestProfilingMiddleware:
+    """Считает запросы к БД и их время, находит повторяющиеся запросы
+    (признак N+1) и отдаёт длительность фаз в заголовке Server-Timing
+    и строкой лога. Включается настройкой REQUEST_PROFILING."""
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = settings.REQUEST_PROFILING_SLOW_MS
+        self.repeated_threshold = settings.REQUEST_PROFILING_REPEATED_QUERIES
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        request._profile = profile
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+        profile.set_view_end()
+        timings = profile.get_timings(time.perf_counter())
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration:.1f}'
+            + (f';desc="{profile.queries} queries"' if name == 'db' else '')
+            for name, duration in timings.items()
+        )
+        self.log(request, response, profile, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.set_view_start()
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            profile.set_view_end()
+            profile.render_start = time.perf_counter()
+            response.add_post_render_callback(profile.set_render_end)
+        return response
+
+    def log(self, request, response, profile, timings):
+        repeated = profile.get_repeated(self.repeated_threshold)
+        slow = timings['total'] >= self.slow_ms
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': profile.queries,
+            **{f'{name}_ms': round(duration, 1)
+               for name, duration in timings.items()},
+            'slow': slow,
+            'repeated_queries': [{'sql': shape, 'count': count}
+                                 for shape, count in repeated],
+        }
+        level = logging.WARNING if slow or repeated else logging.INFO
+        logger.log(level, json.dumps(record, ensure_ascii=False))
@@ -1,5 +1,150 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по ключу сортировки (курсору).
+    Страница выбирается условием на значения ключа последней записи,
+    без OFFSET и без подсчёта общего количества записей."""
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering, page_size, page_query_param=None):
+        self.ordering = ordering
+        self.page_size = page_size
+        self.page_query_param = page_query_param
+
+    def encode_cursor(self, obj, reverse):
+        position = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        cursor = json.dumps({'p': position, 'r': reverse},
+                            default=lambda value: value.isoformat())
+        encoded = base64.urlsafe_b64encode(cursor.encode()).decode()
+        url = self.request.build_absolute_uri()
+        if self.page_query_param:
+            url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, model):
+        encoded = self.request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, cursor['p'])
+            ]
+            reverse = bool(cursor['r'])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_keyset_filter(self, position, reverse):
+        """Условие «запись идёт после position» в порядке сортировки:
+        a <= x AND ((a < x) OR (a = x AND b < y) OR ...) для убывающих
+        полей. Лишнее a <= x даёт границу по первому столбцу индекса,
+        по OR без неё PostgreSQL проходит все записи до курсора."""
+        condition = Q()
+        equal = Q()
+        bound = None
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            if bound is None:
+                bound = Q(**{f'{name}__{lookup}e': value})
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return bound & condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        position, reverse = self.decode_cursor(queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}'
+                        for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_keyset_filter(position, reverse))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
 
 
 class LimitPagination(PageNumberPagination):
+    """Постраничный вывод с параметрами page и limit.
+    Если задан cursor_ordering, параметр cursor включает вывод по ключу
+    этой сортировки (KeysetPagination) без подсчёта количества.
+    Параметры из cursor_ignored_by задают другую сортировку выборки,
+    с ними курсор не используется и вывод остаётся постраничным."""
     page_size_query_param = 'limit'
+    cursor_ordering = None
+    cursor_ignored_by = ()
+    keyset = None
+
+    def use_keyset(self, request):
+        params = request.query_params
+        return (
+            self.cursor_ordering is not None
+            and KeysetPagination.cursor_query_param in params
+            and not any(params.get(name) for name in self.cursor_ignored_by)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.keyset = KeysetPagination(
+                self.cursor_ordering, self.get_page_size(request),
+                self.page_query_param
+            )
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(LimitPagination):
+    cursor_ordering = ('-pub_date', '-id')
+    # результаты поиска упорядочены по релевантности, а не по дате.
+    cursor_ignored_by = ('search',)
+
+
+class UserPagination(LimitPagination):
+    cursor_ordering = ('id',)
@@ -0,0 +1,84 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .versions import bump_on_commit, get_version
+
+VERSION_NAME = 'responses'
+KEY = 'response:{}'
+LOCK_KEY = 'response-lock:{}'
+# сколько держать блокировку перестроения и сколько ждать чужого.
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 3.0
+WAIT_STEP = 0.05
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def invalidate():
+    """Сбрасывает все закешированные ответы сменой поколения
+    после фиксации текущей транзакции."""
+    bump_on_commit(VERSION_NAME, using=settings.RESPONSE_CACHE_ALIAS)
+
+
+def get_key(request):
+    """Ключ ответа: путь и параметры запроса без учёта их порядка
+    и пустых значений."""
+    query = sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values if value != ''
+    )
+    raw = f'{request.path}?{urlencode(query)}'
+    return KEY.format(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def wait_for(store, key, generation):
+    """Ждёт, пока другой процесс перестроит ответ."""
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        cached = store.get(key)
+        if cached is not None and cached['generation'] == generation:
+            return cached
+    return None
+
+
+def get_or_build(request, build):
+    """Возвращает (None, запись) из кеша или (ответ, запись) от build.
+    build возвращает ответ и запись для кеша или None, если ответ
+    кешировать нельзя. Устаревшую запись перестраивает один процесс,
+    остальные тем временем отдают прежнюю или ждут её."""
+    store = get_cache()
+    key = get_key(request)
+    generation = get_version(VERSION_NAME,
+                             using=settings.RESPONSE_CACHE_ALIAS)
+    cached = store.get(key)
+    if (cached is not None and cached['generation'] == generation
+            and cached['expires'] > time.time()):
+        return None, cached['entry']
+    lock = LOCK_KEY.format(key)
+    locked = store.add(lock, 1, LOCK_TIMEOUT)
+    if not locked:
+        if cached is None:
+            cached = wait_for(store, key, generation)
+        if cached is not None:
+            return None, cached['entry']
+    try:
+        response, entry = build()
+        if entry is not None:
+            timeout = settings.RESPONSE_CACHE_TIMEOUT
+            store.set(key, {
+                'generation': generation,
+                'expires': time.time() + timeout,
+                'entry': entry,
+            }, timeout + settings.RESPONSE_CACHE_STALE_TIMEOUT)
+    finally:
+        if locked:
+            store.delete(lock)
+    return response, entry
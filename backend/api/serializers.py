@@ -1,13 +1,17 @@
 import base64
+from collections import defaultdict
 
 from django.core.files.base import ContentFile
 from django.core.validators import validate_email
-from django.db import transaction
+from django.db import models, transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import ReadOnlyField, SerializerMethodField
 
+from recipes import shopping_list, similarity
+from recipes.images import (DERIVATIVE_FORMATS, DERIVATIVE_SIZES,
+                            get_derivative_name)
 from recipes.models import (Favorite, Ingredient, Recipe,
                             RecipeIngredient, ShoppingCart, Tag)
 from users.models import Follow, User
@@ -15,6 +19,70 @@ from users.models import Follow, User
 VALID_SYMBOLS = (
     'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_'
 )
+BULK_MAX_RECIPES = 100
+
+
+def get_followed_authors(request):
+    """Возвращает множество id авторов, на которых подписан пользователь.
+    Загружается одним запросом и хранится в объекте запроса, поэтому
+    все сериализаторы в рамках запроса используют общий результат."""
+    followed = getattr(request, '_followed_authors', None)
+    if followed is None:
+        followed = set(Follow.objects.filter(
+            user=request.user).values_list('author_id', flat=True))
+        request._followed_authors = followed
+    return followed
+
+
+def get_recipes_limit(request):
+    """Возвращает значение параметра recipes_limit или None,
+    если параметр не передан или не является положительным числом."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None or not recipes_limit.isdigit():
+        return None
+    return int(recipes_limit) or None
+
+
+def get_url_builder(request, storage=None):
+    """Функция, которая строит ссылку на файл так же, как поля
+    файлов DRF: абсолютную, если известен запрос."""
+    if storage is None:
+        storage = Recipe._meta.get_field('image').storage
+    if request is None:
+        return storage.url
+    return lambda name: request.build_absolute_uri(storage.url(name))
+
+
+def get_derivative_urls(name, ready, get_url):
+    """Ссылки на уменьшенные копии картинки name: пока копии
+    не готовы, все ссылки ведут на оригинал."""
+    if not name:
+        return None
+    if not ready:
+        original = get_url(name)
+        return {size: {extension: original
+                       for extension in DERIVATIVE_FORMATS}
+                for size in DERIVATIVE_SIZES}
+    return {
+        size: {
+            extension: get_url(get_derivative_name(name, size, extension))
+            for extension in DERIVATIVE_FORMATS
+        }
+        for size in DERIVATIVE_SIZES
+    }
+
+
+def get_recipe_info(recipe, get_url):
+    """Краткое описание рецепта, как у RecipeInfoSerializer."""
+    image = recipe.image.name
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'image': get_url(image) if image else None,
+        'images': get_derivative_urls(
+            image, recipe.image_derivatives_ready, get_url),
+        'cooking_time': recipe.cooking_time,
+    }
 
 
 class UsersCreateSerializer(UserCreateSerializer):
@@ -68,10 +136,10 @@ class UsersSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, object):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        request = self.context.get('request')
+        if request.user.is_anonymous:
             return False
-        return Follow.objects.filter(user=user, author=object.id).exists()
+        return object.id in get_followed_authors(request)
 
 
 class FollowSerializer(UsersSerializer):
@@ -81,6 +149,7 @@ class FollowSerializer(UsersSerializer):
 
     class Meta(UsersSerializer.Meta):
         fields = UsersSerializer.Meta.fields + ('recipes', 'recipes_count')
+        read_only_fields = fields
 
     def validate(self, data):
         author = self.instance
@@ -103,14 +172,18 @@ class FollowSerializer(UsersSerializer):
     def get_recipes(self, object):
         request = self.context.get('request')
         context = {'request': request}
-        recipe_limit = request.GET.get('recipes_limit')
-        queryset = object.recipes.prefetch_related('ingredients', 'tags').all()
-        if recipe_limit:
-            queryset = queryset[:int(recipe_limit)]
+        # в списке подписок рецепты всех авторов страницы
+        # загружены заранее одним запросом (UsersViewSet.subscriptions).
+        queryset = getattr(object, 'limited_recipes', None)
+        if queryset is None:
+            queryset = object.recipes.all()
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit:
+                queryset = queryset[:recipes_limit]
         return RecipeInfoSerializer(queryset, context=context, many=True).data
 
     def get_recipes_count(self, object):
-        return object.recipes.count()
+        return object.recipes_count
 
 
 class Base64ImageField(serializers.ImageField):
@@ -124,6 +197,21 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+class ImageDerivativesField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки рецепта в WebP и JPEG.
+    Пока копии не созданы, все ссылки ведут на оригинал."""
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        get_url = get_url_builder(self.context.get('request'),
+                                  recipe.image.storage)
+        return get_derivative_urls(recipe.image.name,
+                                   recipe.image_derivatives_ready, get_url)
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для работы с тегами."""
     class Meta:
@@ -151,10 +239,9 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
-    """Сериализатор для добавления ингредиента при создании рецепта."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient')
+    """Сериализатор для добавления ингредиента при создании рецепта.
+    Ингредиенты по id загружает RecipeSerializer одним запросом."""
+    id = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = RecipeIngredient
@@ -166,6 +253,9 @@ class RecipeSerializer(serializers.ModelSerializer):
     Валидирует ингредиенты ответ возвращает GetRecipeSerializer."""
     author = UsersSerializer(read_only=True)
     image = Base64ImageField()
+    # теги по id загружаются в validate_tags одним запросом.
+    tags = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False)
     ingredients = AddIngredientSerializer(many=True)
 
     class Meta:
@@ -173,9 +263,32 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'tags', 'author', 'ingredients',
                   'name', 'image', 'text', 'cooking_time')
 
+    def validate_tags(self, value):
+        """Находит все теги одним запросом."""
+        tags = Tag.objects.in_bulk(value)
+        unknown = [pk for pk in value if pk not in tags]
+        if unknown:
+            raise ValidationError(
+                f'Теги не найдены: {", ".join(map(str, unknown))}'
+            )
+        return [tags[pk] for pk in dict.fromkeys(value)]
+
+    def validate_ingredients(self, value):
+        """Находит все ингредиенты одним запросом."""
+        ids = [item['id'] for item in value]
+        ingredients = Ingredient.objects.in_bulk(ids)
+        unknown = [pk for pk in ids if pk not in ingredients]
+        if unknown:
+            raise ValidationError(
+                f'Ингредиенты не найдены: {", ".join(map(str, unknown))}'
+            )
+        return [{'ingredient': ingredients[item['id']],
+                 'amount': item['amount']} for item in value]
+
     def validate(self, data):
         # создаём список ингредиентов в рецепте, ингредиенты могут повторяться.
-        list_ingr = [item['ingredient'] for item in data['ingredients']]
+        list_ingr = [item['ingredient']
+                     for item in data.get('ingredients', ())]
         # определяем длину списка ингредиентов и длину его множества.
         all_ingredients, distinct_ingredients = (
             len(list_ingr), len(set(list_ingr)))
@@ -202,44 +315,181 @@ class RecipeSerializer(serializers.ModelSerializer):
                                        **validated_data)
         recipe.tags.set(tags)
         self.get_ingredients(recipe, ingredients)
+        similarity.schedule_update(recipe.pk)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Сравнивает состав рецепта с новым и вставляет, изменяет
+        и удаляет только отличающиеся строки. Возвращает старый
+        и новый составы {id ингредиента: количество}."""
+        existing = {item.ingredient_id: item for item in
+                    RecipeIngredient.objects.filter(recipe=recipe)}
+        old_amounts = {pk: item.amount for pk, item in existing.items()}
+        new_amounts = {item['ingredient'].id: item['amount']
+                       for item in ingredients}
+        removed = [item.pk for pk, item in existing.items()
+                   if pk not in new_amounts]
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        changed = []
+        for pk, item in existing.items():
+            if pk in new_amounts and new_amounts[pk] != item.amount:
+                item.amount = new_amounts[pk]
+                changed.append(item)
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in new_amounts.items() if pk not in existing
+        )
+        return old_amounts, new_amounts
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        instance.tags.set(tags)
-        self.get_ingredients(instance, ingredients)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            old_amounts, new_amounts = self.update_ingredients(
+                instance, ingredients)
+            shopping_list.change_recipe(instance, old_amounts, new_amounts)
+            if old_amounts.keys() != new_amounts.keys():
+                similarity.schedule_update(instance.pk)
+        if 'image' in validated_data:
+            instance.image_derivatives_ready = False
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
-        context = {'request': self.context.get('request')}
-        return GetRecipeSerializer(instance, context=context).data
+        request = self.context.get('request')
+        instance = Recipe.objects.with_related().with_user_flags(
+            request.user).get(pk=instance.pk)
+        return GetRecipeSerializer(instance, context={'request': request}).data
+
+
+def get_page_tags(recipe_ids):
+    """Теги рецептов страницы одним запросом: {id рецепта: [тег]}."""
+    tags, result = {}, defaultdict(list)
+    for recipe_id, *row in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).order_by('tag_id').values_list(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__color', 'tag__slug'):
+        if row[0] not in tags:
+            tags[row[0]] = dict(zip(('id', 'name', 'color', 'slug'), row))
+        result[recipe_id].append(tags[row[0]])
+    return result
+
+
+def get_page_ingredients(recipe_ids):
+    """Ингредиенты рецептов страницы одним запросом:
+    {id рецепта: [ингредиент с количеством]}."""
+    result = defaultdict(list)
+    for recipe_id, *row in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).order_by('id').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'):
+        result[recipe_id].append(
+            dict(zip(('id', 'name', 'measurement_unit', 'amount'), row)))
+    return result
+
+
+def get_page_flags(recipes, request, name, model):
+    """id рецептов страницы с признаком name: из аннотации
+    RecipeQuerySet.with_user_flags или одним запросом."""
+    user = request.user
+    if user.is_anonymous or not recipes:
+        return set()
+    if hasattr(recipes[0], name):
+        return {recipe.id for recipe in recipes if getattr(recipe, name)}
+    return set(model.objects.filter(
+        user=user, recipe_id__in=[recipe.id for recipe in recipes]
+    ).values_list('recipe_id', flat=True))
+
+
+class RecipeInfoListSerializer(serializers.ListSerializer):
+    """Список кратких описаний рецептов без вызова полей
+    RecipeInfoSerializer для каждого рецепта."""
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        get_url = get_url_builder(self.context.get('request'))
+        return [get_recipe_info(recipe, get_url) for recipe in recipes]
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов без вложенных сериализаторов на каждое поле.
+    Теги и ингредиенты страницы загружаются двумя запросами values_list,
+    поэтому в выборке нужен только select_related('author'). Вывод
+    совпадает с выводом GetRecipeSerializer (проверяет benchmark)."""
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, models.Manager) else data)
+        request = self.context.get('request')
+        ids = [recipe.id for recipe in recipes]
+        tags, ingredients = get_page_tags(ids), get_page_ingredients(ids)
+        favorited = get_page_flags(recipes, request, 'is_favorited',
+                                   Favorite)
+        in_cart = get_page_flags(recipes, request, 'is_in_shopping_cart',
+                                 ShoppingCart)
+        followed = (set() if request.user.is_anonymous
+                    else get_followed_authors(request))
+        get_url = get_url_builder(request)
+        authors, result = {}, []
+        for recipe in recipes:
+            if recipe.author_id not in authors:
+                author = recipe.author
+                authors[author.id] = {
+                    'email': author.email,
+                    'id': author.id,
+                    'username': author.username,
+                    'first_name': author.first_name,
+                    'last_name': author.last_name,
+                    'is_subscribed': author.id in followed,
+                }
+            info = get_recipe_info(recipe, get_url)
+            result.append({
+                'id': recipe.id,
+                'tags': tags[recipe.id],
+                'author': authors[recipe.author_id],
+                'ingredients': ingredients[recipe.id],
+                'is_favorited': recipe.id in favorited,
+                'is_in_shopping_cart': recipe.id in in_cart,
+                'name': recipe.name,
+                'image': info['image'],
+                'images': info['images'],
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            })
+        return result
 
 
 class GetRecipeSerializer(serializers.ModelSerializer):
-    """Сериализатор для отображения полной информации о рецепте."""
+    """Сериализатор для отображения полной информации о рецепте.
+    Списки выводит RecipeListSerializer."""
     tags = TagSerializer(many=True, read_only=True)
     author = UsersSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(read_only=True, many=True,
                                              source='recipes_ingredient')
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    images = ImageDerivativesField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'images', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, object):
+        # признак уже вычислен в запросе RecipeQuerySet.with_user_flags.
+        if hasattr(object, 'is_favorited'):
+            return object.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return object.favorites.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, object):
+        if hasattr(object, 'is_in_shopping_cart'):
+            return object.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -261,8 +511,8 @@ class FavoriteSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
-        context = {'request': self.context.get('request')}
-        return RecipeInfoSerializer(instance.recipe, context=context).data
+        return get_recipe_info(
+            instance.recipe, get_url_builder(self.context.get('request')))
 
 
 class ShoppingCartSerializer(FavoriteSerializer):
@@ -271,8 +521,20 @@ class ShoppingCartSerializer(FavoriteSerializer):
         model = ShoppingCart
 
 
+class BulkRecipesSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления/удаления."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_RECIPES
+    )
+
+
 class RecipeInfoSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения краткой информации о рецепте."""
+    images = ImageDerivativesField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+        list_serializer_class = RecipeInfoListSerializer
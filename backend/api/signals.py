@@ -0,0 +1,96 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.images import derivatives_ready
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.shopping_list import shopping_lists_changed
+from users.models import Follow, User
+from users.signals import users_updated
+
+from . import ingredient_index, response_cache, tag_cache
+from .authentication import invalidate_token, invalidate_users
+from .conditional import (RECIPES_VERSION, SHOPPING_LIST_VERSION,
+                          SHOPPING_LISTS_VERSION, USER_STATE_VERSION,
+                          USERS_VERSION)
+from .versions import bump_on_commit
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_on_commit(ingredient_index.VERSION_NAME)
+    transaction.on_commit(ingredient_index.ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(post_delete, sender=Recipe)
+def invalidate_tags(sender, **kwargs):
+    bump_on_commit(tag_cache.VERSION_NAME)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_on_commit(tag_cache.VERSION_NAME)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user(sender, instance, update_fields=None, created=False,
+                    **kwargs):
+    # вход пользователя меняет только last_login, которого нет в ответах.
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump_on_commit(USERS_VERSION)
+        response_cache.invalidate()
+        # смена пароля и блокировка отзывают кешированные токены;
+        # у нового пользователя их нет, токены удалённого отзываются
+        # при каскадном удалении.
+        if not created and kwargs['signal'] is post_save:
+            invalidate_users((instance.pk,))
+
+
+@receiver(users_updated, sender=User)
+def invalidate_updated_users(sender, pks, **kwargs):
+    """Блокировка через QuerySet.update тоже отзывает токены."""
+    bump_on_commit(USERS_VERSION)
+    response_cache.invalidate()
+    invalidate_users(pks)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_responses(sender, action=None, **kwargs):
+    if action is None or action.startswith('post_'):
+        bump_on_commit(RECIPES_VERSION)
+        response_cache.invalidate()
+
+
+@receiver(derivatives_ready, sender=Recipe)
+def invalidate_recipe_images(sender, **kwargs):
+    """Готовые копии картинки меняют ссылки в ответах."""
+    bump_on_commit(RECIPES_VERSION)
+    response_cache.invalidate()
+
+
+@receiver(shopping_lists_changed, sender=ShoppingListItem)
+def invalidate_shopping_lists(sender, user_ids, **kwargs):
+    if user_ids is None:
+        bump_on_commit(SHOPPING_LISTS_VERSION)
+    for user_id in user_ids or ():
+        bump_on_commit(SHOPPING_LIST_VERSION.format(user_id))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_user_state(sender, instance, **kwargs):
+    bump_on_commit(USER_STATE_VERSION.format(instance.user_id))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
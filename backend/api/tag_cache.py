@@ -0,0 +1,33 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from recipes.models import Tag
+
+from .versions import get_version
+
+VERSION_NAME = 'tags'
+CACHE_KEY = 'tags:{}'
+CACHE_TIMEOUT = 60 * 60
+
+
+def get_used_tags():
+    """Возвращает теги, у которых есть рецепты, и ETag их содержимого.
+    Результат хранится в кеше до смены версии тегов."""
+    key = CACHE_KEY.format(get_version(VERSION_NAME))
+    cached = cache.get(key)
+    if cached is None:
+        tags = list(Tag.objects.filter(
+            recipes__isnull=False
+        ).distinct().order_by('id').values('id', 'name', 'color', 'slug'))
+        etag = hashlib.sha1(json.dumps(tags).encode()).hexdigest()
+        cached = (tags, f'"{etag}"')
+        cache.set(key, cached, CACHE_TIMEOUT)
+    return cached
+
+
+def get_tag_choices():
+    """Варианты для фильтра рецептов по слагу тега."""
+    tags, _ = get_used_tags()
+    return [(tag['slug'], tag['name']) for tag in tags]
@@ -0,0 +1,101 @@
+import base64
+import io
+
+from django.core.cache import cache
+from PIL import Image
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from api import response_cache
+from api.authentication import token_cache
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import Follow, User
+
+PASSWORD = 'Test-password-42'
+
+
+def get_image():
+    content = io.BytesIO()
+    Image.new('RGB', (8, 8), '#49b64e').save(content, 'PNG')
+    encoded = base64.b64encode(content.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class FoodgramTestMixin:
+    """Общие данные тестов API: пользователи, теги, ингредиенты
+    и рецепты, а также пустые кеши перед каждым тестом."""
+    @classmethod
+    def create_catalog(cls):
+        cls.user = cls.create_user('user')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', color='#000000',
+                               slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(40)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        response_cache.get_cache().clear()
+        token_cache.clear()
+
+    @staticmethod
+    def create_user(name):
+        return User.objects.create_user(
+            email=f'{name}@example.com', username=name, first_name='Имя',
+            last_name='Фамилия', password=PASSWORD)
+
+    @classmethod
+    def create_recipe(cls, author, name='Рецепт', ingredients=None,
+                      tags=None, amount=10):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text='Описание',
+            image='recipes/test.png', image_derivatives_ready=True,
+            cooking_time=10)
+        recipe.tags.set(cls.tags[:2] if tags is None else tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient in (cls.ingredients[:3] if ingredients is None
+                               else ingredients)
+        )
+        return recipe
+
+    @classmethod
+    def create_authors(cls, count, recipes_per_author=2, follower=None):
+        """Авторы с рецептами; follower подписывается на всех."""
+        authors = []
+        for number in range(count):
+            author = cls.create_user(f'author{number}')
+            for index in range(recipes_per_author):
+                cls.create_recipe(author, f'Рецепт {number}-{index}')
+            if follower is not None:
+                Follow.objects.create(user=follower, author=author)
+            authors.append(author)
+        return authors
+
+    def recipe_payload(self, name='Новый рецепт', ingredients=3):
+        return {
+            'name': name, 'text': 'Описание', 'cooking_time': 15,
+            'image': get_image(),
+            'tags': [tag.id for tag in self.tags[:2]],
+            'ingredients': [{'id': ingredient.id, 'amount': 10}
+                            for ingredient in self.ingredients[:ingredients]],
+        }
+
+
+class FoodgramTestCase(FoodgramTestMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+
+
+class FoodgramTransactionTestCase(FoodgramTestMixin, APITransactionTestCase):
+    """Для проверок работы, которая выполняется после фиксации
+    транзакции (transaction.on_commit)."""
+    def setUp(self):
+        super().setUp()
+        self.create_catalog()
@@ -0,0 +1,98 @@
+import tempfile
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from api.authentication import (CachedTokenAuthentication, is_cache_enabled,
+                                token_cache)
+from users.models import User
+
+from .base import FoodgramTestCase, FoodgramTransactionTestCase
+
+
+class LocalCacheTests(FoodgramTestCase):
+    """С кешем в памяти процесса токены не кешируются."""
+    def test_token_is_not_cached(self):
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertFalse(is_cache_enabled())
+        self.assertIsNone(token_cache.get(token.key))
+
+
+class SharedCacheTests(FoodgramTransactionTestCase):
+    """Кешированный токен отзывается любым изменением пользователя."""
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = self.settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': directory.name,
+            },
+            'responses': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+        super().setUp()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_is_cached(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.assertTrue(is_cache_enabled())
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/users/me/')
+        self.assertFalse(any('authtoken_token' in query['sql']
+                             for query in queries))
+
+    def test_queryset_update_revokes_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_save_revokes_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_logout_revokes_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_logout_during_lookup_revokes_token(self):
+        lookup = TokenAuthentication.authenticate_credentials
+
+        def lookup_and_logout(authentication, key):
+            # выход фиксируется сразу после чтения токена из базы.
+            credentials = lookup(authentication, key)
+            Token.objects.filter(key=key).delete()
+            return credentials
+
+        with mock.patch.object(TokenAuthentication,
+                               'authenticate_credentials',
+                               lookup_and_logout):
+            self.assertEqual(
+                self.client.get('/api/users/me/').status_code, 200)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_cached_user_is_not_shared(self):
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(self.token.key)
+        first._state.fields_cache.clear()
+        first.first_name = 'Изменённое'
+        second, _ = authentication.authenticate_credentials(self.token.key)
+        self.assertEqual(second.first_name, self.user.first_name)
+        self.assertIn('auth_token', second._state.fields_cache)
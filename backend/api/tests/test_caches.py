@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import transaction
+
+from api import response_cache, tag_cache
+from api.conditional import USER_STATE_VERSION
+from api.versions import get_version
+from recipes.models import Favorite
+
+from .base import FoodgramTransactionTestCase
+
+
+class CacheInvalidationTests(FoodgramTransactionTestCase):
+    """Версии кешей меняются после фиксации транзакции, чтобы
+    параллельный запрос не сохранил под новой версией старые данные."""
+    def test_tag_version_bumped_after_commit(self):
+        recipe = self.create_recipe(self.user, tags=self.tags[:1])
+        version = get_version(tag_cache.VERSION_NAME)
+        with transaction.atomic():
+            recipe.tags.add(self.tags[2])
+            self.assertEqual(get_version(tag_cache.VERSION_NAME), version)
+        self.assertNotEqual(get_version(tag_cache.VERSION_NAME), version)
+
+    def test_used_tags(self):
+        self.create_recipe(self.user, tags=self.tags[:1])
+        slugs = [tag['slug'] for tag in self.client.get('/api/tags/').data]
+        self.assertEqual(slugs, ['tag0'])
+        recipe = self.create_recipe(self.user, tags=self.tags[1:2])
+        slugs = [tag['slug'] for tag in self.client.get('/api/tags/').data]
+        self.assertEqual(slugs, ['tag0', 'tag1'])
+        recipe.delete()
+        slugs = [tag['slug'] for tag in self.client.get('/api/tags/').data]
+        self.assertEqual(slugs, ['tag0'])
+
+    def test_response_generation_bumped_after_commit(self):
+        version = get_version(response_cache.VERSION_NAME,
+                              settings.RESPONSE_CACHE_ALIAS)
+        with transaction.atomic():
+            self.create_recipe(self.user)
+            self.assertEqual(get_version(response_cache.VERSION_NAME,
+                                         settings.RESPONSE_CACHE_ALIAS),
+                             version)
+        self.assertNotEqual(get_version(response_cache.VERSION_NAME,
+                                        settings.RESPONSE_CACHE_ALIAS),
+                            version)
+
+    def test_anonymous_responses_follow_changes(self):
+        recipe = self.create_recipe(self.user, 'Старое название')
+        path = f'/api/recipes/{recipe.id}/'
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 1)
+        self.assertEqual(self.client.get(path).data['name'],
+                         'Старое название')
+        self.client.force_authenticate(self.user)
+        self.client.patch(path, {'name': 'Новое название'}, format='json')
+        self.client.post('/api/recipes/', self.recipe_payload(),
+                         format='json')
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 2)
+        self.assertEqual(self.client.get(path).data['name'],
+                         'Новое название')
+
+    def test_user_state_version_bumped_after_commit(self):
+        recipe = self.create_recipe(self.user)
+        name = USER_STATE_VERSION.format(self.user.id)
+        version = get_version(name)
+        with transaction.atomic():
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            self.assertEqual(get_version(name), version)
+        self.assertNotEqual(get_version(name), version)
+
+    def test_ingredient_index_follows_changes(self):
+        path = '/api/ingredients/?name=ингредиент 1'
+        self.assertEqual(len(self.client.get(path).data), 11)
+        with transaction.atomic():
+            self.ingredients[1].delete()
+            self.assertEqual(len(self.client.get(path).data), 11)
+        self.assertEqual(len(self.client.get(path).data), 10)
@@ -0,0 +1,71 @@
+from django.utils.http import http_date
+
+from recipes.images import derivatives_ready
+from recipes.models import Recipe
+
+from .base import FoodgramTransactionTestCase
+
+
+class ConditionalGetTests(FoodgramTransactionTestCase):
+    """Ответ 304 зависит только от ETag, который меняется вместе
+    с данными ответа."""
+    def setUp(self):
+        super().setUp()
+        self.recipes = [self.create_recipe(self.user, f'Рецепт {number}')
+                        for number in range(3)]
+
+    def test_no_last_modified(self):
+        response = self.client.get('/api/recipes/')
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(
+            '/api/recipes/', HTTP_IF_MODIFIED_SINCE=http_date(4102444800))
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified(self):
+        for client_user in (None, self.user):
+            self.client.force_authenticate(client_user)
+            etag = self.client.get('/api/recipes/')['ETag']
+            response = self.client.get('/api/recipes/',
+                                       HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            path = f'/api/recipes/{self.recipes[0].id}/'
+            etag = self.client.get(path)['ETag']
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_on_delete(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.recipes[0].delete()
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_etag_changes_on_ingredient_rename(self):
+        path = f'/api/recipes/{self.recipes[0].id}/'
+        etag = self.client.get(path)['ETag']
+        ingredient = self.ingredients[0]
+        ingredient.name = 'Новое название'
+        ingredient.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ingredients'][0]['name'],
+                         'Новое название')
+
+    def test_list_etag_changes_on_images_ready(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_derivatives_ready=False)
+        etag = self.client.get('/api/recipes/?cursor=')['ETag']
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_derivatives_ready=True)
+        derivatives_ready.send(sender=Recipe, recipe_id=recipe.pk)
+        response = self.client.get('/api/recipes/?cursor=',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_etag_changes_on_recipe_tags(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.recipes[0].tags.set(self.tags[2:])
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
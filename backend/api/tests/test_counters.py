@@ -0,0 +1,117 @@
+import io
+
+from django.core.management import call_command
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes import counters
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+from .base import PASSWORD, FoodgramTestCase
+
+
+class CounterTests(FoodgramTestCase):
+    """Обычное сохранение объекта не затирает счётчики,
+    изменённые после его загрузки."""
+    def test_set_password_keeps_followers_count(self):
+        author = self.create_user('author')
+        token = Token.objects.create(user=author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        follower = APIClient()
+        follower.force_authenticate(self.user)
+        response = follower.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': PASSWORD, 'new_password': 'New-password-42'})
+        self.assertEqual(response.status_code, 204)
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.assertTrue(author.check_password('New-password-42'))
+
+    def test_stale_save_keeps_counters(self):
+        recipe = self.create_recipe(self.user)
+        stale_recipe = Recipe.objects.get(pk=recipe.pk)
+        stale_user = User.objects.get(pk=self.user.pk)
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        stale_recipe.name = 'Новое название'
+        stale_recipe.save()
+        stale_user.first_name = 'Новое имя'
+        stale_user.save()
+        recipe.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(
+            (recipe.favorites_count, recipe.shopping_cart_count), (1, 1))
+        self.assertEqual(self.user.first_name, 'Новое имя')
+        self.assertEqual(self.user.recipes_count, 1)
+
+
+class CounterChangesTests(FoodgramTestCase):
+    """Счётчики следуют за каскадными удалениями и массовыми
+    операциями и пересчитываются командой recount_counters."""
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.recipes = [self.create_recipe(self.author, f'Рецепт {number}')
+                        for number in range(2)]
+        self.client.force_authenticate(self.user)
+
+    def get_counters(self):
+        self.author.refresh_from_db()
+        return {
+            'recipes': self.author.recipes_count,
+            'followers': self.author.followers_count,
+            'favorites': list(Recipe.objects.filter(
+                author=self.author).order_by('id').values_list(
+                'favorites_count', 'shopping_cart_count')),
+        }
+
+    def test_bulk_favorite_and_cart(self):
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        for path in ('favorite', 'shopping_cart'):
+            response = self.client.post(f'/api/recipes/{path}/',
+                                        {'recipes': recipe_ids},
+                                        format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_counters()['favorites'], [(1, 1), (1, 1)])
+        response = self.client.delete('/api/recipes/favorite/',
+                                      {'recipes': recipe_ids[:1]},
+                                      format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_counters()['favorites'], [(0, 1), (1, 1)])
+
+    def test_cascade_delete(self):
+        follower = self.create_user('follower')
+        Follow.objects.create(user=follower, author=self.author)
+        for recipe in self.recipes:
+            Favorite.objects.create(user=follower, recipe=recipe)
+            ShoppingCart.objects.create(user=follower, recipe=recipe)
+        self.assertEqual(self.get_counters(), {
+            'recipes': 2, 'followers': 1, 'favorites': [(1, 1), (1, 1)]})
+        follower.delete()
+        self.assertEqual(self.get_counters(), {
+            'recipes': 2, 'followers': 0, 'favorites': [(0, 0), (0, 0)]})
+        self.recipes[0].delete()
+        self.assertEqual(self.get_counters()['recipes'], 1)
+
+    def test_recount_counters(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        Follow.objects.create(user=self.user, author=self.author)
+        expected = self.get_counters()
+        # поля счётчиков меняются без сигналов и расходятся с данными.
+        User.objects.filter(pk=self.author.pk).update(
+            recipes_count=0, followers_count=5)
+        Recipe.objects.update(favorites_count=3, shopping_cart_count=0)
+        call_command('recount_counters', stdout=io.StringIO())
+        self.assertEqual(self.get_counters(), expected)
+
+    def test_nested_suspended(self):
+        with counters.suspended():
+            with counters.suspended():
+                self.assertTrue(counters.is_suspended())
+            self.assertTrue(counters.is_suspended())
+        self.assertFalse(counters.is_suspended())
@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import override_settings
+
+from recipes import feed
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+from .base import FoodgramTransactionTestCase
+
+
+class FeedTests(FoodgramTransactionTestCase):
+    """Новый рецепт расходится по лентам подписчиков, изменённый только
+    поднимается по дате, длина ленты ограничена."""
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        Follow.objects.create(user=self.user, author=self.author)
+        self.client.force_authenticate(self.author)
+
+    def get_feed(self):
+        return list(FeedEntry.objects.filter(user=self.user).order_by(
+            *feed.ORDERING).values_list('recipe_id', 'pub_date'))
+
+    def test_edit_moves_recipe_without_fanout(self):
+        first = self.create_recipe(self.author, 'Первый')
+        second = self.create_recipe(self.author, 'Второй')
+        self.assertEqual([pk for pk, _ in self.get_feed()],
+                         [second.id, first.id])
+        with mock.patch.object(feed, 'fanout') as fanout:
+            response = self.client.patch(f'/api/recipes/{first.id}/',
+                                         {'name': 'Изменённый'},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        fanout.assert_not_called()
+        first = Recipe.objects.get(pk=first.id)
+        self.assertEqual(self.get_feed()[0], (first.id, first.pub_date))
+
+    @override_settings(FEED_MAX_LENGTH=2)
+    def test_trim_keeps_latest_entries(self):
+        recipes = [self.create_recipe(self.author, f'Рецепт {number}')
+                   for number in range(3)]
+        others = [self.create_user(f'other{number}') for number in range(3)]
+        for other in others:
+            Follow.objects.create(user=other, author=self.author)
+        user_ids = [self.user.id, *(other.id for other in others)]
+        # рассылка и подписка уже обрезали ленты, дополняем их заново.
+        feed.add_entries(
+            FeedEntry(user_id=user_id, recipe_id=recipe.id,
+                      author_id=self.author.id, pub_date=recipe.pub_date)
+            for user_id in user_ids for recipe in recipes
+        )
+        self.assertEqual(FeedEntry.objects.count(), 3 * len(user_ids))
+        # ленты всех подписчиков обрезаются одним запросом.
+        with transaction.atomic(), self.assertNumQueries(1):
+            feed.trim(user_ids)
+        self.assertEqual([pk for pk, _ in self.get_feed()],
+                         [recipes[2].id, recipes[1].id])
+        for other in others:
+            self.assertEqual(
+                list(FeedEntry.objects.filter(user=other).order_by(
+                    *feed.ORDERING).values_list('recipe_id', flat=True)),
+                [recipes[2].id, recipes[1].id])
@@ -0,0 +1,63 @@
+from django.core.files.storage import default_storage
+
+from recipes.images import (DERIVATIVE_FORMATS, DERIVATIVE_SIZES,
+                            get_derivative_name)
+from recipes.models import Recipe
+
+from .base import FoodgramTransactionTestCase
+
+
+def get_derivative_names(name):
+    return [get_derivative_name(name, size, extension)
+            for size in DERIVATIVE_SIZES for extension in DERIVATIVE_FORMATS]
+
+
+class ImageDerivativesTests(FoodgramTransactionTestCase):
+    """Копии картинки создаются после сохранения рецепта, копии
+    прежней картинки удаляются, пока копий нет — ссылки на оригинал."""
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def create(self):
+        response = self.client.post('/api/recipes/', self.recipe_payload(),
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def test_derivatives_are_generated(self):
+        recipe = self.create()
+        self.assertTrue(recipe.image_derivatives_ready)
+        name = recipe.image.name
+        for derivative in get_derivative_names(name):
+            self.assertTrue(default_storage.exists(derivative), derivative)
+        images = self.client.get(f'/api/recipes/{recipe.id}/').data['images']
+        self.assertTrue(images['card']['webp'].endswith(
+            get_derivative_name(name, 'card', 'webp')))
+
+    def test_image_change_deletes_old_derivatives(self):
+        recipe = self.create()
+        old_name = recipe.image.name
+        response = self.client.patch(f'/api/recipes/{recipe.id}/',
+                                     self.recipe_payload('Новая картинка'),
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertNotEqual(recipe.image.name, old_name)
+        self.assertTrue(recipe.image_derivatives_ready)
+        for derivative in get_derivative_names(old_name):
+            self.assertFalse(default_storage.exists(derivative), derivative)
+        for derivative in get_derivative_names(recipe.image.name):
+            self.assertTrue(default_storage.exists(derivative), derivative)
+
+    def test_not_ready_images_link_to_original(self):
+        recipe = self.create_recipe(self.user)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_derivatives_ready=False)
+        detail = self.client.get(f'/api/recipes/{recipe.id}/').data
+        listed = self.client.get('/api/recipes/').data['results'][0]
+        for data in (detail, listed):
+            self.assertEqual(
+                {url for formats in data['images'].values()
+                 for url in formats.values()},
+                {data['image']})
@@ -0,0 +1,57 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+from .base import FoodgramTestCase
+
+
+class CursorPaginationTests(FoodgramTestCase):
+    """Страницы по курсору проходят выборку без пропусков и повторов,
+    в том числе среди рецептов с одинаковой датой."""
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(7):
+            cls.create_recipe(cls.user, f'Рецепт {number}')
+        # половина рецептов с одной датой: порядок решает id.
+        same_date = Recipe.objects.order_by('id')[:4].values('id')
+        Recipe.objects.filter(id__in=same_date).update(
+            pub_date=timezone.now())
+        cls.expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return ([item['id'] for item in response.data['results']],
+                response.data['next'], response.data['previous'])
+
+    def test_round_trip(self):
+        pages = []
+        url = '/api/recipes/?limit=3&cursor='
+        while url:
+            ids, url, previous = self.get_ids(url)
+            pages.append((ids, previous))
+        self.assertEqual([pk for ids, _ in pages for pk in ids],
+                         self.expected)
+        self.assertIsNone(pages[0][1])
+        backward = []
+        url = pages[-1][1]
+        while url:
+            ids, _, url = self.get_ids(url)
+            backward = ids + backward
+        self.assertEqual(backward + pages[-1][0], self.expected)
+
+    def test_first_column_bound(self):
+        _, url, _ = self.get_ids('/api/recipes/?limit=3&cursor=')
+        with CaptureQueriesContext(connection) as context:
+            self.get_ids(url)
+        sql = next(query['sql'] for query in context.captured_queries
+                   if 'LIMIT 4' in query['sql'])
+        self.assertIn('"recipes_recipe"."pub_date" <=', sql)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
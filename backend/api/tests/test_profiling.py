@@ -0,0 +1,25 @@
+import re
+
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from .base import FoodgramTestCase
+
+TIMING = re.compile(r'(\w+);dur=([\d.]+)')
+
+
+@override_settings(REQUEST_PROFILING=True)
+class ServerTimingTests(FoodgramTestCase):
+    """Фазы Server-Timing не пересекаются и в сумме дают весь запрос."""
+    def test_phases_add_up_to_total(self):
+        self.create_recipe(self.user)
+        with self.assertLogs('api.profiling', 'INFO'):
+            response = APIClient().get('/api/recipes/')
+        timings = {name: float(duration) for name, duration
+                   in TIMING.findall(response['Server-Timing'])}
+        self.assertEqual(
+            list(timings), ['db', 'view', 'render', 'middleware', 'total'])
+        self.assertGreater(timings['view'], 0)
+        self.assertGreater(timings['render'], 0)
+        total = timings.pop('total')
+        self.assertAlmostEqual(sum(timings.values()), total, delta=0.5)
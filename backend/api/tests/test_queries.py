@@ -0,0 +1,114 @@
+from recipes.models import Recipe
+
+from .base import FoodgramTestCase
+
+PAGE_SIZES = (2, 10)
+
+
+class QueryCountTests(FoodgramTestCase):
+    """Число запросов к БД не зависит от размера страницы
+    и от числа ингредиентов и тегов рецепта."""
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.authors = cls.create_authors(12, follower=cls.user)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def assert_page_queries(self, num, path):
+        separator = '&' if '?' in path else '?'
+        for size in PAGE_SIZES:
+            with self.subTest(limit=size), self.assertNumQueries(num):
+                response = self.client.get(f'{path}{separator}limit={size}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), size)
+
+    def test_recipe_list(self):
+        self.assert_page_queries(5, '/api/recipes/')
+
+    def test_recipe_list_cursor(self):
+        self.assert_page_queries(4, '/api/recipes/?cursor=')
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_page_queries(4, '/api/recipes/')
+
+    def test_subscriptions(self):
+        self.assert_page_queries(
+            3, '/api/users/subscriptions/?recipes_limit=1')
+
+    def test_users_list(self):
+        self.assert_page_queries(3, '/api/users/')
+
+    def test_recipe_detail(self):
+        for count in (1, 8):
+            recipe = self.create_recipe(
+                self.user, ingredients=self.ingredients[:count])
+            with self.subTest(ingredients=count), self.assertNumQueries(5):
+                response = self.client.get(f'/api/recipes/{recipe.id}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['ingredients']), count)
+
+    def test_recipe_create(self):
+        # теги, как и ингредиенты, загружаются одним запросом.
+        for count, tags in ((1, 1), (8, 3)):
+            payload = self.recipe_payload(ingredients=count)
+            payload['tags'] = [tag.id for tag in self.tags[:tags]]
+            with self.subTest(ingredients=count, tags=tags), \
+                    self.assertNumQueries(14):
+                response = self.client.post('/api/recipes/', payload,
+                                            format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['ingredients']), count)
+            self.assertEqual(len(response.data['tags']), tags)
+
+    def test_recipe_update(self):
+        # весь состав заменяется: count удалений и count вставок.
+        for count in (1, 5):
+            recipe = self.create_recipe(
+                self.user, ingredients=self.ingredients[6:6 + count])
+            with self.subTest(ingredients=count), self.assertNumQueries(19):
+                response = self.client.patch(
+                    f'/api/recipes/{recipe.id}/',
+                    self.recipe_payload('Изменённый', ingredients=count),
+                    format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['ingredients']), count)
+
+    def test_favorite(self):
+        recipe = Recipe.objects.exclude(author=self.user).first()
+        with self.assertNumQueries(6):
+            response = self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(5):
+            response = self.client.delete(
+                f'/api/recipes/{recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_bulk_favorite(self):
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        for count in PAGE_SIZES:
+            with self.subTest(recipes=count), self.assertNumQueries(6):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'recipes': recipes[:count]},
+                    format='json')
+            self.assertEqual(response.status_code, 200)
+            with self.subTest(recipes=count), self.assertNumQueries(7):
+                response = self.client.delete(
+                    '/api/recipes/favorite/', {'recipes': recipes[:count]},
+                    format='json')
+            self.assertEqual(response.status_code, 200)
+
+    def test_subscribe(self):
+        author = self.create_user('stranger')
+        self.create_recipe(author)
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                f'/api/users/{author.id}/subscribe/?recipes_limit=1')
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(5):
+            response = self.client.delete(
+                f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
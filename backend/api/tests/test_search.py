@@ -0,0 +1,70 @@
+from .base import FoodgramTransactionTestCase
+
+
+class SearchDocumentTests(FoodgramTransactionTestCase):
+    """Поисковые документы обновляются один раз за транзакцию,
+    независимо от числа строк ингредиентов."""
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def test_delete_queries_do_not_depend_on_ingredients(self):
+        for count in (1, 30):
+            recipe = self.create_recipe(
+                self.user, ingredients=self.ingredients[:count])
+            with self.subTest(ingredients=count), self.assertNumQueries(20):
+                response = self.client.delete(f'/api/recipes/{recipe.id}/')
+            self.assertEqual(response.status_code, 204)
+
+    def test_update_queries_do_not_depend_on_ingredients(self):
+        for count in (1, 10):
+            recipe = self.create_recipe(
+                self.user, ingredients=self.ingredients[20:20 + count])
+            with self.subTest(ingredients=count), self.assertNumQueries(31):
+                response = self.client.patch(
+                    f'/api/recipes/{recipe.id}/',
+                    self.recipe_payload('Изменённый', ingredients=count),
+                    format='json')
+            self.assertEqual(response.status_code, 200)
+            recipe.delete()
+
+    def test_documents_follow_changes(self):
+        recipe = self.create_recipe(
+            self.user, 'Борщ', ingredients=self.ingredients[:2])
+        self.assertEqual(self.search('борщ'), [recipe.id])
+        self.client.patch(f'/api/recipes/{recipe.id}/', {
+            'name': 'Щи', 'ingredients': [
+                {'id': self.ingredients[5].id, 'amount': 1}]},
+            format='json')
+        self.assertEqual(self.search('борщ'), [])
+        self.assertEqual(self.search('щи ингредиент 5'), [recipe.id])
+        self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(self.search('щи'), [])
+
+    def test_ranking(self):
+        in_text = self.create_recipe(self.user, 'Суп')
+        in_text.text = 'Почти борщ'
+        in_text.save()
+        in_name = self.create_recipe(self.user, 'Борщ')
+        self.create_recipe(self.user, 'Каша')
+        response = self.client.get('/api/recipes/', {'search': 'борщ'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(self.search('борщ'), [in_name.id, in_text.id])
+        self.assertEqual(self.search('бор'), [in_name.id, in_text.id])
+
+    def test_cursor_keeps_ranking(self):
+        # рецепт с совпадением в названии старше, по дате он был бы вторым.
+        in_name = self.create_recipe(self.user, 'Борщ')
+        in_text = self.create_recipe(self.user, 'Суп')
+        in_text.text = 'Почти борщ'
+        in_text.save()
+        response = self.client.get('/api/recipes/',
+                                   {'search': 'борщ', 'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [in_name.id, in_text.id])
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        return [item['id'] for item in response.data['results']]
@@ -0,0 +1,67 @@
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import GetRecipeSerializer, RecipeInfoSerializer
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+from .base import FoodgramTestCase
+
+
+class ListSerializerParityTests(FoodgramTestCase):
+    """Списочные сериализаторы (RecipeListSerializer,
+    RecipeInfoListSerializer) отдают те же байты JSON, что и вывод
+    по полям GetRecipeSerializer и RecipeInfoSerializer."""
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        authors = cls.create_authors(3, recipes_per_author=3)
+        recipes = list(Recipe.objects.all())
+        for number, recipe in enumerate(recipes):
+            recipe.tags.set(cls.tags[:number % 3])
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes[::2]]
+        ).update(image_derivatives_ready=False)
+        Recipe.objects.filter(pk=recipes[-1].pk).update(image='')
+        for recipe in recipes[::3]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in recipes[1::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        authors[0].following.create(user=cls.user)
+
+    def make_request(self, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def render(self, user, serializer_class, fast):
+        context = {'request': self.make_request(user)}
+        recipes = Recipe.objects.with_user_flags(user)
+        if fast:
+            data = serializer_class(recipes.select_related('author'),
+                                    many=True, context=context).data
+        else:
+            data = ListSerializer(recipes.with_related(),
+                                  child=serializer_class(),
+                                  context=context).data
+        return JSONRenderer().render(data)
+
+    def test_fast_paths_match_field_output(self):
+        for user in (AnonymousUser(), self.user):
+            for serializer_class in (GetRecipeSerializer,
+                                     RecipeInfoSerializer):
+                with self.subTest(user=user,
+                                  serializer=serializer_class.__name__):
+                    self.assertEqual(
+                        self.render(user, serializer_class, True),
+                        self.render(user, serializer_class, False))
+
+    def test_output_covers_flags_and_images(self):
+        output = self.render(self.user, GetRecipeSerializer, True)
+        for fragment in (b'"is_favorited":true', b'"is_favorited":false',
+                         b'"is_in_shopping_cart":true',
+                         b'"is_subscribed":true', b'_card.webp',
+                         b'"images":null'):
+            self.assertIn(fragment, output)
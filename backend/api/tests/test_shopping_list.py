@@ -0,0 +1,193 @@
+import csv
+import io
+from unittest import mock
+
+from rest_framework.test import APIClient
+
+from recipes import shopping_list
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+from users.models import User
+
+from .base import PASSWORD, FoodgramTestCase, FoodgramTransactionTestCase
+
+DOWNLOAD_URL = '/api/recipes/download_shopping_cart/'
+
+
+class ShoppingListTestMixin:
+    def get_shopping_list(self, user):
+        return dict(user.shopping_list.values_list('ingredient_id', 'amount'))
+
+    def get_cart_totals(self, user):
+        """Суммы ингредиентов по корзине, посчитанные заново."""
+        return shopping_list.get_total_amounts(ShoppingCart.objects.filter(
+            user=user).values_list('recipe_id', flat=True))
+
+
+class ShoppingListTotalsTests(ShoppingListTestMixin, FoodgramTestCase):
+    """Список покупок совпадает с суммами по корзине после добавления
+    и удаления рецептов, изменения и удаления рецепта автором."""
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.first = self.create_recipe(
+            self.author, 'Первый', ingredients=self.ingredients[:3])
+        self.second = self.create_recipe(
+            self.author, 'Второй', ingredients=self.ingredients[1:4],
+            amount=5)
+        self.client.force_authenticate(self.user)
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+
+    def assert_totals(self, expected):
+        expected = {self.ingredients[number].id: amount
+                    for number, amount in expected.items()}
+        self.assertEqual(self.get_shopping_list(self.user), expected)
+        self.assertEqual(self.get_cart_totals(self.user), expected)
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=csv')
+        rows = list(csv.reader(io.StringIO(
+            b''.join(response.streaming_content).decode())))[1:]
+        names = {ingredient.id: ingredient.name
+                 for ingredient in self.ingredients}
+        self.assertEqual(
+            sorted(rows),
+            sorted([names[pk], 'г', str(amount)]
+                   for pk, amount in expected.items()))
+
+    def test_totals_follow_changes(self):
+        self.client.post(f'/api/recipes/{self.first.id}/shopping_cart/')
+        self.client.post('/api/recipes/shopping_cart/',
+                         {'recipes': [self.second.id]}, format='json')
+        self.assert_totals({0: 10, 1: 15, 2: 15, 3: 5})
+        self.author_client.patch(f'/api/recipes/{self.second.id}/', {
+            'ingredients': [{'id': self.ingredients[1].id, 'amount': 20},
+                            {'id': self.ingredients[4].id, 'amount': 1}]},
+            format='json')
+        self.assert_totals({0: 10, 1: 30, 2: 10, 4: 1})
+        self.client.delete('/api/recipes/shopping_cart/',
+                           {'recipes': [self.first.id]}, format='json')
+        self.assert_totals({1: 20, 4: 1})
+        self.author_client.delete(f'/api/recipes/{self.second.id}/')
+        self.assert_totals({})
+
+    def test_concurrent_insert(self):
+        bulk_create = ShoppingListItem.objects.bulk_create
+
+        def insert_concurrently(items, **kwargs):
+            # другая транзакция успела создать ту же позицию.
+            ShoppingListItem.objects.create(
+                user=self.user, ingredient=self.ingredients[0], amount=7)
+            return bulk_create(items, **kwargs)
+
+        with mock.patch.object(ShoppingListItem.objects, 'bulk_create',
+                               insert_concurrently):
+            shopping_list.add_recipe(self.user, self.first)
+        self.assertEqual(self.get_shopping_list(self.user), {
+            self.ingredients[0].id: 17, self.ingredients[1].id: 10,
+            self.ingredients[2].id: 10})
+
+
+class AdminShoppingListTests(ShoppingListTestMixin, FoodgramTestCase):
+    """Изменения корзин и составов рецептов в админке
+    переносятся в списки покупок."""
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin',
+            first_name='Имя', last_name='Фамилия', password=PASSWORD)
+        self.client.force_login(admin)
+        self.recipe = self.create_recipe(self.user, amount=10)
+
+    def add_to_cart(self):
+        response = self.client.post('/admin/recipes/shoppingcart/add/', {
+            'user': self.user.id, 'recipe': self.recipe.id})
+        self.assertEqual(response.status_code, 302)
+        return ShoppingCart.objects.get(user=self.user, recipe=self.recipe)
+
+    def test_cart_add_and_delete(self):
+        cart = self.add_to_cart()
+        self.assertEqual(
+            self.get_shopping_list(self.user),
+            {ingredient.id: 10 for ingredient in self.ingredients[:3]})
+        response = self.client.post(
+            f'/admin/recipes/shoppingcart/{cart.id}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_shopping_list(self.user), {})
+
+    def test_cart_bulk_delete(self):
+        cart = self.add_to_cart()
+        self.assertTrue(self.get_shopping_list(self.user))
+        self.client.post('/admin/recipes/shoppingcart/', {
+            'action': 'delete_selected', '_selected_action': [cart.id],
+            'post': 'yes'})
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertEqual(self.get_shopping_list(self.user), {})
+
+    def test_recipe_ingredient_change_and_delete(self):
+        self.add_to_cart()
+        row = RecipeIngredient.objects.get(
+            recipe=self.recipe, ingredient=self.ingredients[0])
+        response = self.client.post(
+            f'/admin/recipes/recipeingredient/{row.id}/change/', {
+                'recipe': self.recipe.id,
+                'ingredient': self.ingredients[5].id, 'amount': 25})
+        self.assertEqual(response.status_code, 302)
+        expected = {self.ingredients[1].id: 10, self.ingredients[2].id: 10,
+                    self.ingredients[5].id: 25}
+        self.assertEqual(self.get_shopping_list(self.user), expected)
+        self.client.post('/admin/recipes/recipeingredient/', {
+            'action': 'delete_selected', '_selected_action': [row.id],
+            'post': 'yes'})
+        del expected[self.ingredients[5].id]
+        self.assertEqual(self.get_shopping_list(self.user), expected)
+
+
+class DownloadShoppingCartTests(FoodgramTransactionTestCase):
+    """Выгрузка списка покупок в разных форматах и её ETag, который
+    меняется вместе со списком."""
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe(self.user, amount=10)
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+
+    def download(self, export_format, **headers):
+        return self.client.get(f'{DOWNLOAD_URL}?format={export_format}',
+                               **headers)
+
+    def test_text(self):
+        response = self.download('txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'text/plain; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Список покупок')
+        self.assertEqual(lines[2:], [
+            f'{number}. {ingredient.name} – 10 г'
+            for number, ingredient in enumerate(
+                sorted(self.ingredients[:3], key=lambda item: item.name),
+                start=1)
+        ])
+
+    def test_pdf(self):
+        response = self.download('pdf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename="shopping_cart.pdf"')
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    def test_unknown_format(self):
+        self.assertEqual(self.download('docx').status_code, 404)
+
+    def test_not_modified_until_list_changes(self):
+        etag = self.download('csv')['ETag']
+        self.assertNotEqual(etag, self.download('txt')['ETag'])
+        with self.assertNumQueries(0):
+            response = self.download('csv', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.delete(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        response = self.download('csv', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,37 @@
+from unittest import mock
+
+from recipes import similarity
+from recipes.models import SimilarRecipe
+
+from .base import FoodgramTransactionTestCase
+
+
+class SimilarUpdateTests(FoodgramTransactionTestCase):
+    """Соседи пересчитываются при создании рецепта и при изменении
+    набора ингредиентов, но не при любом сохранении."""
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipe = self.create_recipe(self.user)
+
+    def test_create_updates_neighbors(self):
+        response = self.client.post('/api/recipes/', self.recipe_payload(),
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(SimilarRecipe.objects.filter(
+            recipe_id=response.data['id'], similar=self.recipe).exists())
+
+    def test_update_ingredient_set(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        with mock.patch.object(similarity, 'update_recipes') as update:
+            self.client.patch(url, {'name': 'Новое название'}, format='json')
+            self.client.patch(url, {'ingredients': [
+                {'id': ingredient.id, 'amount': 20}
+                for ingredient in self.ingredients[:3]
+            ]}, format='json')
+            update.assert_not_called()
+            self.client.patch(url, {'ingredients': [
+                {'id': ingredient.id, 'amount': 20}
+                for ingredient in self.ingredients[:4]
+            ]}, format='json')
+        update.assert_called_once_with((self.recipe.id,))
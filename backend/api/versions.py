@@ -0,0 +1,61 @@
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from recipes.tasks import on_commit_batch
+
+from .cache_backends import FakeRedis, RedisCache
+
+VERSION_KEY = 'version:{}'
+
+
+def initial_version():
+    # начальная версия зависит от времени, чтобы после перезапуска
+    # процесса с локальным кешем версии не повторяли прежние.
+    return time.time_ns() // 1000
+
+
+def is_shared(using=DEFAULT_CACHE_ALIAS):
+    """Видят ли изменения версий в кеше using все процессы сервера.
+    Кеши в памяти процесса, включая FakeRedis, общими не считаются."""
+    cache = caches[using]
+    if isinstance(cache, RedisCache):
+        return not isinstance(cache.client, FakeRedis)
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def get_version(name, using=DEFAULT_CACHE_ALIAS):
+    """Возвращает текущую версию набора данных name.
+    Версии хранятся в кеше using, поэтому при общем бэкенде кеша
+    изменение видно всем процессам."""
+    cache = caches[using]
+    key = VERSION_KEY.format(name)
+    cache.add(key, initial_version(), None)
+    return cache.get(key) or initial_version()
+
+
+def bump_version(name, using=DEFAULT_CACHE_ALIAS):
+    """Увеличивает версию набора данных name после его изменения."""
+    cache = caches[using]
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = initial_version()
+        cache.set(key, version, None)
+        return version
+
+
+def bump_versions(names):
+    for name, using in names:
+        bump_version(name, using)
+
+
+def bump_on_commit(name, using=DEFAULT_CACHE_ALIAS):
+    """Увеличивает версию после фиксации текущей транзакции. Иначе
+    запрос, прочитавший базу между сменой версии и фиксацией, сохранит
+    старые данные под новой версией. Изменения одной транзакции меняют
+    версию один раз."""
+    on_commit_batch(bump_versions, ((name, using),))
@@ -1,41 +1,53 @@
-from django.http import HttpResponse
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from reportlab.pdfbase import pdfmetrics, ttfonts
-from reportlab.pdfgen import canvas
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import (SAFE_METHODS, AllowAny,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes import counters, shopping_list
+from recipes.feed import ORDERING as FEED_ORDERING
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, Tag)
 from users.models import Follow, User
 
+from .conditional import (USER_STATE_VERSION, ConditionalGetMixin,
+                          get_catalog_etag, get_recipe_etag,
+                          get_recipes_etag, get_shopping_list_etag,
+                          get_users_etag)
+from .exports import export_shopping_list, get_shopping_list
 from .filters import IngredientFilter, RecipeFilter
-from .paginations import LimitPagination
+from .ingredient_index import VERSION_NAME as INGREDIENTS_VERSION
+from .ingredient_index import ingredient_index
+from .paginations import (KeysetPagination, RecipePagination,
+                          UserPagination)
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (FavoriteSerializer,
-                          FollowSerializer, IngredientSerializer,
+from .renderers import (CSVRenderer, PDFRenderer, ShoppingListNegotiation,
+                        TextRenderer)
+from .serializers import (BulkRecipesSerializer, FavoriteSerializer,
+                          FollowSerializer, GetRecipeSerializer,
+                          IngredientSerializer, RecipeInfoSerializer,
                           RecipeSerializer, ShoppingCartSerializer,
-                          TagSerializer, UsersSerializer)
+                          TagSerializer, UsersSerializer, get_recipes_limit)
+from .tag_cache import VERSION_NAME as TAGS_VERSION
+from .tag_cache import get_used_tags
+from .versions import bump_on_commit
 
-COORDINATE_X = 100
-COORDINATE_X_LIST = 80
-COORDINATE_Y = 750
-HEIGHT = 700
-HEIGHT_STEP = 25
-FONT_SIZE = 14
 
-
-class UsersViewSet(UserViewSet):
+class UsersViewSet(ConditionalGetMixin, UserViewSet):
     """Вьюсет для работы с пользователями и подписками.
     Обработка запросов на создание/получение пользователей и
     создание/получение/удаления подписок."""
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('id')
     serializer_class = UsersSerializer
     permission_classes = (AllowAny,)
-    pagination_class = LimitPagination
+    pagination_class = UserPagination
+    cache_anonymous = True
     http_method_names = ['get', 'post', 'delete', 'head']
 
     def get_permissions(self):
@@ -43,6 +55,14 @@ class UsersViewSet(UserViewSet):
             self.permission_classes = (IsAuthenticated,)
         return super().get_permissions()
 
+    def get_list_etag(self, request):
+        return get_users_etag(request)
+
+    def get_object_etag(self, request):
+        # 404 и проверка прав — до ответа 304.
+        self.get_object()
+        return get_users_etag(request)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -70,15 +90,23 @@ class UsersViewSet(UserViewSet):
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        follows = User.objects.filter(following__user=user)
+        follows = User.objects.filter(following__user=user).order_by('id')
         page = self.paginate_queryset(follows)
+        recipes = Recipe.objects.filter(author__in=page)
+        recipes_limit = get_recipes_limit(request)
+        if recipes_limit:
+            recipes = recipes.limit_per_author(recipes_limit)
+        prefetch_related_objects(
+            page, Prefetch('recipes', queryset=recipes,
+                           to_attr='limited_recipes')
+        )
         serializer = FollowSerializer(
             instance=page, many=True,
             context={'request': request})
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для обработки запросов на получение ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -86,28 +114,72 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     permission_classes = (AllowAny,)
     pagination_class = None
+    cache_anonymous = True
+
+    def get_list_etag(self, request):
+        return get_catalog_etag(INGREDIENTS_VERSION)
+
+    def get_object_etag(self, request):
+        return get_catalog_etag(INGREDIENTS_VERSION)
+
+    def list(self, request, *args, **kwargs):
+        # автодополнение обслуживается индексом без обращения к базе.
+        name = request.query_params.get('name')
+        if name:
+            return self.conditional_response(
+                lambda: Response(ingredient_index.search(name)),
+                self.get_list_etag(request)
+            )
+        return super().list(request, *args, **kwargs)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для обработки запросов на получение тегов."""
     queryset = Tag.objects.filter(recipes__isnull=False).distinct()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    cache_anonymous = True
 
+    def get_object_etag(self, request):
+        return get_catalog_etag(TAGS_VERSION)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        tags, etag = get_used_tags()
+        return self.conditional_response(lambda: Response(tags), etag)
+
+
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами.
      Обработка запросов создания/получения/редактирования/удаления рецептов
      Добавление/удаление рецепта в избранное и список покупок"""
-    queryset = Recipe.objects.select_related('author').prefetch_related(
-        'ingredients', 'tags'
-    ).all()
+    queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly,)
-    pagination_class = LimitPagination
+    pagination_class = RecipePagination
+    cache_anonymous = True
+
+    def get_queryset(self):
+        queryset = super().get_queryset().with_user_flags(self.request.user)
+        if self.action == 'list':
+            # теги и ингредиенты страницы загружает RecipeListSerializer.
+            queryset = queryset.select_related('author')
+        elif self.action == 'retrieve':
+            queryset = queryset.with_related()
+        return queryset
+
+    def get_serializer_class(self):
+        if self.request.method in SAFE_METHODS:
+            return GetRecipeSerializer
+        return RecipeSerializer
+
+    def get_list_etag(self, request):
+        return get_recipes_etag(request)
+
+    def get_object_etag(self, request):
+        return get_recipe_etag(request, self.kwargs['pk'])
 
     def action_post_delete(self, pk, serializer_class):
         user = self.request.user
@@ -139,38 +211,109 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(methods=['POST', 'DELETE'],
             detail=True)
+    @transaction.atomic
     def shopping_cart(self, request, pk):
-        return self.action_post_delete(pk, ShoppingCartSerializer)
+        response = self.action_post_delete(pk, ShoppingCartSerializer)
+        if response.status_code == status.HTTP_201_CREATED:
+            shopping_list.add_recipe(request.user, pk)
+        elif response.status_code == status.HTTP_204_NO_CONTENT:
+            shopping_list.remove_recipe(request.user, pk)
+        return response
 
-    @action(detail=False)
+    def action_bulk(self, model):
+        """Добавляет или удаляет сразу несколько рецептов одной транзакцией
+        и возвращает результат для каждого id."""
+        serializer = BulkRecipesSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(
+            serializer.validated_data['recipes']))
+        user = self.request.user
+        found = set(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('id', flat=True))
+        present = set(model.objects.filter(
+            user=user, recipe_id__in=found
+        ).values_list('recipe_id', flat=True))
+        if self.request.method == 'POST':
+            changed = found - present
+            model.objects.bulk_create(
+                (model(user=user, recipe_id=pk) for pk in changed),
+                ignore_conflicts=True
+            )
+            statuses = ('created', 'exists')
+            counters.change_related(model, changed, 1)
+        else:
+            changed = present
+            with counters.suspended():
+                model.objects.filter(
+                    user=user, recipe_id__in=changed).delete()
+            statuses = ('deleted', 'missing')
+            counters.change_related(model, changed, -1)
+        bump_on_commit(USER_STATE_VERSION.format(user.id))
+        results = [
+            {'id': pk, 'status': 'not_found' if pk not in found
+             else statuses[0] if pk in changed else statuses[1]}
+            for pk in recipe_ids
+        ]
+        return Response({'results': results}), changed
+
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='favorite', permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def bulk_favorite(self, request):
+        response, _ = self.action_bulk(Favorite)
+        return response
+
+    @action(methods=['POST', 'DELETE'], detail=False,
+            url_path='shopping_cart', permission_classes=[IsAuthenticated])
+    @transaction.atomic
+    def bulk_shopping_cart(self, request):
+        response, changed = self.action_bulk(ShoppingCart)
+        if request.method == 'POST':
+            shopping_list.add_recipes(request.user, changed)
+        else:
+            shopping_list.remove_recipes(request.user, changed)
+        return response
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        """Рецепты с наибольшим пересечением ингредиентов из заранее
+        посчитанной таблицы похожих рецептов (recipes.similarity)."""
+        recipe = get_object_or_404(Recipe, pk=pk)
+        similar = recipe.similar_recipes.order_by(
+            '-score', 'similar_id').select_related('similar')
+        serializer = RecipeInfoSerializer(
+            [item.similar for item in similar], many=True,
+            context={'request': request})
+        return Response(serializer.data)
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь.
+        Страница ленты читается по индексу записей FeedEntry с курсором,
+        затем рецепты страницы загружаются по id."""
+        paginator = KeysetPagination(
+            FEED_ORDERING, RecipePagination().get_page_size(request))
+        entries = paginator.paginate_queryset(
+            FeedEntry.objects.filter(user=request.user), request, self)
+        recipes = Recipe.objects.with_user_flags(
+            request.user).select_related('author').in_bulk(
+            [entry.recipe_id for entry in entries])
+        serializer = GetRecipeSerializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            renderer_classes=(PDFRenderer, TextRenderer, CSVRenderer),
+            content_negotiation_class=ShoppingListNegotiation)
     def download_shopping_cart(self, request):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = (
-            "attachment; filename='shopping_cart.pdf'"
-        )
-        p = canvas.Canvas(response)
-        arial = ttfonts.TTFont('Arial', 'data/arial.ttf')
-        pdfmetrics.registerFont(arial)
-        p.setFont('Arial', FONT_SIZE)
-
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_carts__user=request.user).values_list(
-            'ingredient__name', 'amount', 'ingredient__measurement_unit')
-
-        ingr_list = {}
-        for name, amount, unit in ingredients:
-            if name not in ingr_list:
-                ingr_list[name] = {'amount': amount, 'unit': unit}
-            else:
-                ingr_list[name]['amount'] += amount
-        height = HEIGHT
-
-        p.drawString(COORDINATE_X, COORDINATE_Y, 'Список покупок')
-        for i, (name, data) in enumerate(ingr_list.items(), start=1):
-            p.drawString(
-                COORDINATE_X_LIST, height,
-                f"{i}. {name} – {data['amount']} {data['unit']}")
-            height -= HEIGHT_STEP
-        p.showPage()
-        p.save()
+        export_format = request.accepted_renderer.format
+        etag = get_shopping_list_etag(request, export_format)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = export_shopping_list(
+                get_shopping_list(request.user).iterator(), export_format)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
         return response
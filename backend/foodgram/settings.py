@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +71,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+TEST_RUNNER = 'foodgram.test_runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -111,7 +114,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -145,6 +148,80 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'back_static/')
 MEDIA_URL = '/back_media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'back_media/')
 
+# background worker pool (image derivatives)
+
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', default=2))
+
+# subscription feed length per user, see recipes.feed
+
+FEED_MAX_LENGTH = int(os.getenv('FEED_MAX_LENGTH', default=500))
+
+# caches: locmem, file or redis (api.cache_backends.RedisCache)
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'api.cache_backends.RedisCache',
+}
+
+
+def get_cache_settings(prefix, name):
+    backend = os.getenv(f'{prefix}_BACKEND', default='locmem')
+    location = (os.path.join(BASE_DIR, 'cache', name)
+                if backend == 'file' else name)
+    options = {}
+    if backend == 'redis':
+        # redis.Redis или api.cache_backends.FakeRedis для разработки.
+        options['CLIENT_CLASS'] = os.getenv('REDIS_CLIENT_CLASS',
+                                            default='redis.Redis')
+    return {
+        'BACKEND': CACHE_BACKENDS[backend],
+        'LOCATION': os.getenv(f'{prefix}_LOCATION', default=location),
+        'OPTIONS': options,
+    }
+
+
+# token authentication cache, see api.authentication
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', default=300))
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=60))
+RESPONSE_CACHE_STALE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_STALE_TIMEOUT', default=300))
+
+CACHES = {
+    'default': get_cache_settings('CACHE', 'default'),
+    RESPONSE_CACHE_ALIAS: get_cache_settings('RESPONSE_CACHE', 'responses'),
+}
+
+# request profiling: Server-Timing header and a log line per request
+
+REQUEST_PROFILING = os.getenv(
+    'REQUEST_PROFILING', default='False').lower() in ('true', '1')
+REQUEST_PROFILING_SLOW_MS = int(
+    os.getenv('REQUEST_PROFILING_SLOW_MS', default=500))
+REQUEST_PROFILING_REPEATED_QUERIES = int(
+    os.getenv('REQUEST_PROFILING_REPEATED_QUERIES', default=3))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # djoser settings
 
 DJOSER = {
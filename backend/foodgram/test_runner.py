@@ -0,0 +1,30 @@
+import shutil
+import tempfile
+
+from django.apps import apps
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Создаёт тестовую базу прямо по моделям: миграции проекта
+    генерируются при развёртывании (makemigrations) и не хранятся
+    в репозитории. Фоновые задачи выполняются в том же потоке."""
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.media_root = tempfile.mkdtemp(prefix='foodgram-tests-')
+        self.test_settings = override_settings(
+            MIGRATION_MODULES={
+                app.label: None for app in apps.get_app_configs()
+            },
+            PASSWORD_HASHERS=[
+                'django.contrib.auth.hashers.MD5PasswordHasher'],
+            MEDIA_ROOT=self.media_root,
+            BACKGROUND_WORKERS=0,
+        )
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -1,12 +1,45 @@
+from collections import defaultdict
+
 from django.contrib.admin import ModelAdmin, register, TabularInline
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 
+from recipes import shopping_list, similarity
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
 
 
+class EstimatedCountPaginator(Paginator):
+    """Для выборки без фильтров в PostgreSQL берёт оценку числа строк
+    из статистики вместо COUNT(*) по всей таблице."""
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if (connection.vendor == 'postgresql'
+                and query is not None and not query.where):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [self.object_list.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(ModelAdmin):
+    """Список без полного пересчёта строк и без запросов на каждую строку.
+    Внешние ключи выбираются поиском, а не полным списком."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 class IngredientInline(TabularInline):
     model = Recipe.ingredients.through
     extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 @register(Ingredient)
@@ -21,19 +54,63 @@ class TagAdmin(ModelAdmin):
 
 
 @register(RecipeIngredient)
-class RecipeIngredientAdmin(ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    def save_model(self, request, obj, form, change):
+        """Строка состава может перейти к другому рецепту или
+        ингредиенту: старая вычитается из списков покупок, новая
+        добавляется."""
+        old = RecipeIngredient.objects.filter(pk=obj.pk).first()
+        super().save_model(request, obj, form, change)
+        if old is not None:
+            self.change_recipes([old], -1)
+        self.change_recipes([obj], 1)
+        if old is not None and old.recipe_id != obj.recipe_id:
+            similarity.schedule_update(old.recipe_id)
+        if old is None or (old.recipe_id, old.ingredient_id) != (
+                obj.recipe_id, obj.ingredient_id):
+            similarity.schedule_update(obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        self.change_recipes([obj], -1)
+        super().delete_model(request, obj)
+        similarity.schedule_update(obj.recipe_id)
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset)
+        self.change_recipes(rows, -1)
+        super().delete_queryset(request, queryset)
+        for recipe_id in {row.recipe_id for row in rows}:
+            similarity.schedule_update(recipe_id)
+
+    @staticmethod
+    def change_recipes(rows, sign):
+        """Переносит строки состава в списки покупок пользователей,
+        у которых их рецепты в корзине."""
+        amounts = defaultdict(dict)
+        for row in rows:
+            amounts[row.recipe_id][row.ingredient_id] = row.amount
+        for recipe_id, items in amounts.items():
+            if sign > 0:
+                shopping_list.change_recipe(recipe_id, {}, items)
+            else:
+                shopping_list.change_recipe(recipe_id, items, {})
 
 
 @register(Recipe)
-class RecipeAdmin(ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     inlines = (
         IngredientInline,
     )
     list_display = ('name', 'author', 'pub_date', 'display_tags', 'favorite')
-    list_filter = ('name', 'author')
+    list_select_related = ('author',)
+    list_filter = ('tags',)
     filter_horizontal = ('tags',)
-    search_fields = ('name',)
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
     readonly_fields = ('favorite',)
     fields = ('image',
               ('name', 'author'),
@@ -41,20 +118,69 @@ class RecipeAdmin(ModelAdmin):
               ('tags', 'cooking_time'),
               'favorite')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('tags')
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.image_derivatives_ready = False
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        """Изменения состава в форме переносятся в списки покупок.
+        Соседи рецепта пересчитываются, если изменился набор
+        ингредиентов."""
+        recipe = form.instance
+        old_amounts = shopping_list.get_amounts(recipe)
+        super().save_related(request, form, formsets, change)
+        new_amounts = shopping_list.get_amounts(recipe)
+        shopping_list.change_recipe(recipe, old_amounts, new_amounts)
+        if old_amounts.keys() != new_amounts.keys():
+            similarity.schedule_update(recipe.pk)
+
     def display_tags(self, obj):
         return ', '.join([tag.name for tag in obj.tags.all()])
     display_tags.short_description = 'Теги'
 
     def favorite(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
     favorite.short_description = 'Раз в избранном'
+    favorite.admin_order_field = 'favorites_count'
 
 
 @register(Favorite)
-class FavoriteAdmin(ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    autocomplete_fields = ('recipe', 'user')
 
 
 @register(ShoppingCart)
-class ShoppingCartAdmin(ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdmin):
     list_display = ('recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    autocomplete_fields = ('recipe', 'user')
+
+    def save_model(self, request, obj, form, change):
+        """Корзина, у которой сменили пользователя или рецепт, убирает
+        старый рецепт из списка покупок и добавляет новый."""
+        old = ShoppingCart.objects.select_related('user').filter(
+            pk=obj.pk).first()
+        super().save_model(request, obj, form, change)
+        if old is not None:
+            if (old.user_id, old.recipe_id) == (obj.user_id, obj.recipe_id):
+                return
+            shopping_list.remove_recipe(old.user, old.recipe_id)
+        shopping_list.add_recipe(obj.user, obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        shopping_list.remove_recipe(obj.user, obj.recipe_id)
+
+    def delete_queryset(self, request, queryset):
+        recipes = defaultdict(list)
+        for cart in queryset.select_related('user'):
+            recipes[cart.user].append(cart.recipe_id)
+        super().delete_queryset(request, queryset)
+        for user, recipe_ids in recipes.items():
+            shopping_list.remove_recipes(user, recipe_ids)
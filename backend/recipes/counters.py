@@ -0,0 +1,66 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# счётчик: (модель, поле, связь, по которой считаются строки).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+# модель-источник: (модель счётчика, поле счётчика, поле со ссылкой).
+SOURCES = {
+    source: (model, field, f'{relation}_id')
+    for model, field, source, relation in COUNTERS
+}
+
+_state = threading.local()
+
+
+@contextmanager
+def suspended():
+    """Отключает обновление счётчиков сигналами в текущем потоке
+    для массовых операций, которые меняют счётчики сами.
+    Вложенный вызов восстанавливает прежнее состояние."""
+    previous = is_suspended()
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+def change(model, pk, field, delta):
+    """Изменяет счётчик одним UPDATE без чтения строки,
+    поэтому одновременные изменения не теряются."""
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def change_related(source, pks, delta):
+    """Изменяет на delta счётчики строк pks, которые считают строки
+    модели source, одним UPDATE на всю пачку."""
+    model, field, _ = SOURCES[source]
+    if pks:
+        model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def recount():
+    """Пересчитывает все счётчики по исходным таблицам."""
+    for model, field, source, relation in COUNTERS:
+        counted = source.objects.filter(
+            **{relation: OuterRef('pk')}
+        ).order_by().values(relation).annotate(total=Count('pk'))
+        model.objects.update(**{field: Coalesce(
+            Subquery(counted.values('total'), output_field=IntegerField()),
+            0
+        )})
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Subquery, Window
+from django.db.models.functions import RowNumber
+
+from recipes.importer import iter_batches
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+# порядок ленты, по нему построен индекс feed_user_pub_date_idx.
+ORDERING = ('-pub_date', '-recipe_id')
+BATCH_SIZE = 1000
+
+
+def add_entries(entries):
+    # пачки режутся здесь: явный batch_size в Django 2.2 не учитывает
+    # ограничений SQLite на число строк в одном INSERT.
+    for batch in iter_batches(entries, BATCH_SIZE):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def trim(user_ids):
+    """Оставляет в лентах пользователей не более FEED_MAX_LENGTH
+    последних записей. Записи нумеруются в окне по пользователю,
+    и лишние удаляются одним DELETE на пачку лент."""
+    user_ids = list(user_ids)
+    size = connection.ops.bulk_batch_size(['user_id'], user_ids)
+    for batch in iter_batches(user_ids, size):
+        ranked = FeedEntry.objects.filter(user_id__in=batch).annotate(
+            position=Window(
+                expression=RowNumber(),
+                partition_by=F('user_id'),
+                order_by=(F('pub_date').desc(), F('recipe_id').desc())
+            )
+        ).values('id', 'position')
+        sql, params = ranked.query.sql_with_params()
+        FeedEntry.objects.extra(
+            where=[f'{FeedEntry._meta.db_table}.id IN ('
+                   f'SELECT ranked.id FROM ({sql}) AS ranked '
+                   f'WHERE ranked.position > %s)'],
+            params=(*params, settings.FEED_MAX_LENGTH)
+        ).delete()
+
+
+@transaction.atomic
+def fanout(recipe_id):
+    """Добавляет новый рецепт в ленты всех подписчиков автора."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date').first()
+    if recipe is None:
+        return
+    followers = list(Follow.objects.filter(
+        author_id=recipe['author_id']).values_list('user_id', flat=True))
+    add_entries(
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, **recipe)
+        for user_id in followers
+    )
+    trim(followers)
+
+
+def move_recipe(recipe_id):
+    """После изменения рецепта его записи поднимаются по новой дате
+    одним UPDATE; дата берётся из рецепта в момент выполнения."""
+    FeedEntry.objects.filter(recipe_id=recipe_id).update(
+        pub_date=Subquery(Recipe.objects.filter(pk=recipe_id).values(
+            'pub_date')[:1]))
+
+
+@transaction.atomic
+def backfill(user_id, author_id):
+    """Добавляет в ленту нового подписчика последние рецепты автора.
+    Если подписку уже отменили, ничего не делает."""
+    recipes = Recipe.objects.filter(
+        author_id=author_id, author__following__user_id=user_id
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date')[:settings.FEED_MAX_LENGTH]
+    add_entries(
+        FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                  author_id=author_id, pub_date=pub_date)
+        for recipe_id, pub_date in recipes
+    )
+    trim([user_id])
+
+
+def remove_author(user_id, author_id):
+    """Убирает рецепты автора из ленты отписавшегося пользователя."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild():
+    """Пересобирает ленты всех пользователей по их подпискам."""
+    FeedEntry.objects.all().delete()
+    count = 0
+    for user_id in Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True).distinct():
+        recipes = Recipe.objects.filter(
+            author__following__user_id=user_id
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'author_id', 'pub_date')[:settings.FEED_MAX_LENGTH]
+        entries = [
+            FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, pub_date=pub_date)
+            for recipe_id, author_id, pub_date in recipes
+        ]
+        add_entries(entries)
+        count += len(entries)
+    return count
@@ -0,0 +1,74 @@
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.dispatch import Signal
+from PIL import Image
+
+from recipes.models import Recipe
+
+# наибольшая сторона производного изображения в пикселях.
+DERIVATIVE_SIZES = {
+    'card': 480,
+    'detail': 960,
+    'retina': 1920,
+}
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+# копии картинки рецепта готовы, аргумент recipe_id.
+derivatives_ready = Signal()
+
+
+def get_derivative_name(name, size, extension):
+    """Имя производного файла рядом с оригиналом."""
+    root, _ = os.path.splitext(name)
+    return f'{root}_{size}.{extension}'
+
+
+def delete_derivatives(name):
+    """Удаляет уменьшенные копии картинки name."""
+    for size in DERIVATIVE_SIZES:
+        for extension in DERIVATIVE_FORMATS:
+            derivative = get_derivative_name(name, size, extension)
+            if default_storage.exists(derivative):
+                default_storage.delete(derivative)
+
+
+def to_rgb(image):
+    """Переводит изображение в RGB, заливая прозрачность белым."""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_derivatives(recipe_id):
+    """Создаёт уменьшенные копии картинки рецепта в WebP и JPEG
+    и отмечает рецепт, если картинка за это время не сменилась.
+    Иначе копии удаляются: они уже не нужны."""
+    name = Recipe.objects.filter(pk=recipe_id).values_list(
+        'image', flat=True).first()
+    if not name:
+        return
+    with default_storage.open(name) as file:
+        original = to_rgb(Image.open(file))
+    for size, max_side in DERIVATIVE_SIZES.items():
+        image = original.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        for extension, (image_format, params) in DERIVATIVE_FORMATS.items():
+            content = io.BytesIO()
+            image.save(content, image_format, **params)
+            derivative = get_derivative_name(name, size, extension)
+            if default_storage.exists(derivative):
+                default_storage.delete(derivative)
+            default_storage.save(derivative, ContentFile(content.getvalue()))
+    if Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_derivatives_ready=True):
+        derivatives_ready.send(sender=Recipe, recipe_id=recipe_id)
+    else:
+        delete_derivatives(name)
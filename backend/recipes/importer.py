@@ -0,0 +1,171 @@
+import csv
+import json
+import os
+import time
+from collections import namedtuple
+from itertools import islice
+
+from django.db import transaction
+
+from recipes.models import Ingredient, Tag
+
+# key — поля, по которым строка файла совпадает со строкой в базе.
+ImportSpec = namedtuple('ImportSpec', ('model', 'key', 'fields'))
+
+IMPORT_SPECS = {
+    'ingredients': ImportSpec(Ingredient, ('measurement_unit', 'name'),
+                              ('name', 'measurement_unit')),
+    'tags': ImportSpec(Tag, ('slug',), ('name', 'color', 'slug')),
+}
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+
+
+class CatalogImportError(Exception):
+    pass
+
+
+class ImportStats:
+    """Итоги загрузки одного файла."""
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.invalid = 0
+        self.start = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def throughput(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f'{self.name}: строк {self.rows}, создано {self.created}, '
+                f'обновлено {self.updated}, без изменений {self.unchanged}, '
+                f'с ошибками {self.invalid} за {self.elapsed:.2f} с '
+                f'({self.throughput:.0f} строк/с)')
+
+
+def read_rows(path):
+    """Построчно читает CSV с заголовком или JSON Lines. Вместо
+    повреждённой строки JSON возвращает None: она считается строкой
+    с ошибкой и не прерывает загрузку остальных."""
+    with open(path, encoding='utf-8', newline='') as file:
+        if path.endswith(JSON_LINES_EXTENSIONS):
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+        else:
+            yield from csv.DictReader(file)
+
+
+def iter_batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def clean_row(spec, row):
+    """Приводит строку файла к значениям полей модели
+    или возвращает None, если строка не подходит."""
+    if not isinstance(row, dict):
+        return None
+    values = {}
+    for name in spec.fields:
+        value = str(row.get(name) or '').strip()
+        max_length = spec.model._meta.get_field(name).max_length
+        if not value or (max_length and len(value) > max_length):
+            return None
+        values[name] = value
+    return values
+
+
+def get_existing(spec, rows):
+    """Находит в базе строки с ключами из пачки одним запросом."""
+    lookups = {f'{name}__in': {row[name] for row in rows}
+               for name in spec.key}
+    return {
+        tuple(getattr(obj, name) for name in spec.key): obj
+        for obj in spec.model.objects.filter(**lookups)
+    }
+
+
+def get_changes(spec, obj, row):
+    return {name: (getattr(obj, name), value) for name, value in row.items()
+            if name not in spec.key and getattr(obj, name) != value}
+
+
+def clean_batch(spec, batch, stats):
+    """Отбрасывает неподходящие строки и повторы ключа внутри пачки
+    (остаётся последняя строка)."""
+    rows = {}
+    for raw in batch:
+        row = clean_row(spec, raw)
+        if row is None:
+            stats.invalid += 1
+            continue
+        rows[tuple(row[name] for name in spec.key)] = row
+    stats.rows += len(batch)
+    return rows
+
+
+def import_batch(spec, batch, stats, dry_run=False, diff=None):
+    """Вставляет новые строки и обновляет изменившиеся. Повторная
+    загрузка того же файла ничего не меняет. diff получает строки
+    с описанием изменений."""
+    rows = clean_batch(spec, batch, stats)
+    existing = get_existing(spec, rows.values()) if rows else {}
+    created, updated = [], []
+    for key, row in rows.items():
+        obj = existing.get(key)
+        if obj is None:
+            created.append(spec.model(**row))
+            if diff is not None:
+                diff.append(f'+ {stats.name}: {row}')
+            continue
+        changes = get_changes(spec, obj, row)
+        if not changes:
+            stats.unchanged += 1
+            continue
+        for name, (_, value) in changes.items():
+            setattr(obj, name, value)
+        updated.append(obj)
+        if diff is not None:
+            diff.append(f'~ {stats.name}: {key} {changes}')
+    stats.created += len(created)
+    stats.updated += len(updated)
+    if dry_run:
+        return
+    update_fields = [name for name in spec.fields if name not in spec.key]
+    with transaction.atomic():
+        # строки, которые успел вставить параллельный импорт, пропускаются.
+        spec.model.objects.bulk_create(created, ignore_conflicts=True)
+        if updated:
+            spec.model.objects.bulk_update(updated, update_fields)
+
+
+def import_file(name, path, batch_size, dry_run=False, diff=None,
+                progress=None):
+    """Загружает файл пачками по batch_size строк."""
+    if name not in IMPORT_SPECS:
+        raise CatalogImportError(f'Неизвестный справочник: {name}')
+    if not os.path.exists(path):
+        raise CatalogImportError(f'Файл не найден: {path}')
+    spec = IMPORT_SPECS[name]
+    stats = ImportStats(name)
+    for batch in iter_batches(read_rows(path), batch_size):
+        import_batch(spec, batch, stats, dry_run, diff)
+        if progress is not None:
+            progress(stats)
+    return stats
@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from recipes import similarity
+
+
+class Command(BaseCommand):
+    help = ('Строит таблицу похожих рецептов по пересечению '
+            'ингредиентов (MinHash/LSH и обратный индекс).')
+
+    def handle(self, *args, **options):
+        count = similarity.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'=== Похожие рецепты посчитаны для рецептов: {count} ===')
+        )
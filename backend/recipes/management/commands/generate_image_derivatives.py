@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from recipes.images import generate_derivatives
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии картинок рецептов, у которых их нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать копии для всех рецептов.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_derivatives_ready=False)
+        count = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            generate_derivatives(recipe_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'=== Обработано рецептов: {count} ===')
+        )
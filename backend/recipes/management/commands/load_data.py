@@ -1,26 +1,98 @@
-import csv
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections
 
+from api import response_cache, tag_cache
+from api.ingredient_index import VERSION_NAME, ingredient_index
+from api.versions import bump_version
 from foodgram import settings
-from recipes.models import Ingredient, Tag
+from recipes.importer import CatalogImportError, import_file
 
-MODELS_FILES = {
-    Ingredient: 'ingredients.csv',
-    Tag: 'tags.csv',
+DEFAULT_FILES = {
+    'ingredients': f'{settings.BASE_DIR}/data/ingredients.csv',
+    'tags': f'{settings.BASE_DIR}/data/tags.csv',
 }
+DEFAULT_BATCH_SIZE = 5000
 
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты и теги из CSV или JSON Lines. '
+            'Существующие записи обновляются, повторный запуск безопасен.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', default=None,
+                            help='Файл ингредиентов (.csv или .jsonl).')
+        parser.add_argument('--tags', default=None,
+                            help='Файл тегов (.csv или .jsonl).')
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Сколько файлов загружать одновременно.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать изменения, не записывая.')
+        parser.add_argument('--diff', action='store_true',
+                            help='Вывести добавляемые и изменяемые строки.')
+
+    def get_files(self, options):
+        files = {name: options[name] for name in DEFAULT_FILES
+                 if options[name]}
+        return files or DEFAULT_FILES
+
+    def progress(self, stats):
+        with self.lock:
+            self.stdout.write(f'{stats.name}: {stats.rows} строк '
+                              f'({stats.throughput:.0f} строк/с)')
+
+    def load(self, name, path, options, diff):
+        try:
+            return import_file(
+                name, path, options['batch_size'], options['dry_run'],
+                diff, self.progress if options['verbosity'] > 1 else None
+            )
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
     def handle(self, *args, **options):
-        for model, file in MODELS_FILES.items():
-            with open(
-                    f'{settings.BASE_DIR}/data/{file}',
-                    'r', encoding='utf-8',
-            ) as table:
-                reader = csv.DictReader(table)
-                model.objects.bulk_create(model(**data) for data in reader)
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        files = self.get_files(options)
+        diff = [] if options['diff'] else None
+        self.lock = threading.Lock()
+        # SQLite допускает только одного пишущего.
+        workers = (1 if connection.vendor == 'sqlite'
+                   else max(1, min(options['workers'], len(files))))
+        try:
+            if workers == 1:
+                results = [self.load(name, path, options, diff)
+                           for name, path in files.items()]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(
+                        lambda item: self.load(*item, options, diff),
+                        files.items()
+                    ))
+        except CatalogImportError as error:
+            raise CommandError(error)
 
+        for line in diff or ():
+            self.stdout.write(line)
+        for stats in results:
+            self.stdout.write(str(stats))
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                '=== Пробный запуск, база не изменена ===')
+            )
+            return
+        # массовые вставки не отправляют сигналы, кеши сбрасываются явно.
+        if 'ingredients' in files:
+            bump_version(VERSION_NAME)
+            ingredient_index.invalidate()
+        if 'tags' in files:
+            bump_version(tag_cache.VERSION_NAME)
+        response_cache.invalidate()
         self.stdout.write(self.style.SUCCESS(
             '=== Ингредиенты и теги успешно загружены ===')
         )
@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок всех пользователей.'
+
+    def handle(self, *args, **options):
+        count = feed.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'=== Записей в лентах: {count} ===')
+        )
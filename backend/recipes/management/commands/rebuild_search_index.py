@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс рецептов.'
+
+    def handle(self, *args, **options):
+        search.ensure_schema()
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'=== Проиндексировано рецептов: {count} ===')
+        )
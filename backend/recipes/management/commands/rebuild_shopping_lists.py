@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные списки покупок по корзинам пользователей.'
+
+    def handle(self, *args, **options):
+        shopping_list.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            '=== Списки покупок пересчитаны ===')
+        )
@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, корзин, рецептов '
+            'и подписчиков.')
+
+    def handle(self, *args, **options):
+        counters.recount()
+        self.stdout.write(self.style.SUCCESS(
+            '=== Счётчики пересчитаны ===')
+        )
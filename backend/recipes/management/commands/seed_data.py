@@ -0,0 +1,119 @@
+import io
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api import response_cache
+from api.tag_cache import VERSION_NAME as TAGS_VERSION
+from api.versions import bump_version
+from recipes import counters, feed, search, shopping_list, similarity
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+IMAGE_NAME = 'recipes/seed.png'
+PASSWORD = 'seed-password'
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу синтетическими пользователями, подписками, '
+            'рецептами, избранным и корзинами поверх load_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows-per-user', type=int, default=5)
+        parser.add_argument('--favorites-per-user', type=int, default=10)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Начальное значение генератора.')
+
+    def get_image(self):
+        if not default_storage.exists(IMAGE_NAME):
+            content = io.BytesIO()
+            Image.new('RGB', (64, 64), '#e26c2d').save(content, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(content.getvalue()))
+        return IMAGE_NAME
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        tags = list(Tag.objects.values_list('id', flat=True))
+        if not ingredients or not tags:
+            raise CommandError('Сначала загрузите ингредиенты и теги: '
+                               'python manage.py load_data')
+        start = User.objects.count()
+        password = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            User(email=f'seed{i}@example.com', username=f'seed{i}',
+                 first_name=f'Имя{i}', last_name=f'Фамилия{i}',
+                 password=password)
+            for i in range(start, start + options['users'])
+        )
+        # bulk_create заполняет id только в PostgreSQL.
+        users = list(User.objects.filter(
+            email__in=[user.email for user in users]).order_by('id'))
+
+        follows = set()
+        for user in users:
+            authors = rnd.sample(users, min(options['follows_per_user'] + 1,
+                                            len(users)))
+            follows.update((user.id, author.id) for author in authors
+                           if author.id != user.id)
+        Follow.objects.bulk_create(
+            Follow(user_id=user, author_id=author)
+            for user, author in sorted(follows)
+        )
+
+        image = self.get_image()
+        Recipe.objects.bulk_create(
+            Recipe(author=rnd.choice(users), name=f'Рецепт {i}',
+                   text=f'Описание рецепта {i}', image=image,
+                   cooking_time=rnd.randint(1, 180))
+            for i in range(options['recipes'])
+        )
+        recipes = list(Recipe.objects.filter(
+            author__in=users).values_list('id', flat=True))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe_id=recipe, ingredient_id=ingredient,
+                             amount=rnd.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rnd.sample(
+                ingredients,
+                min(options['ingredients_per_recipe'], len(ingredients)))
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipes
+            for tag in rnd.sample(tags, min(options['tags_per_recipe'],
+                                            len(tags)))
+        )
+        for model, per_user in ((Favorite, options['favorites_per_user']),
+                                (ShoppingCart, options['cart_per_user'])):
+            model.objects.bulk_create(
+                model(user=user, recipe_id=recipe)
+                for user in users
+                for recipe in rnd.sample(recipes,
+                                         min(per_user, len(recipes)))
+            )
+        # массовые вставки не отправляют сигналы.
+        shopping_list.rebuild(users)
+        counters.recount()
+        search.rebuild()
+        feed.rebuild()
+        similarity.rebuild()
+        bump_version(TAGS_VERSION)
+        response_cache.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'=== Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)}, подписок: {len(follows)} ===')
+        )
@@ -1,8 +1,10 @@
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (Exists, F, OuterRef, Prefetch, UniqueConstraint,
+                              Value, Window)
+from django.db.models.functions import RowNumber
 
-from users.models import User
+from users.models import CountersMixin, User
 
 
 class Ingredient(models.Model):
@@ -59,11 +61,63 @@ class Tag(models.Model):
         return f'{self.name}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    '''
+    Набор запросов рецептов с вычислением признаков текущего пользователя.
+    '''
+    def with_related(self):
+        """Загружает автора, теги и ингредиенты с их названиями
+        фиксированным числом запросов на всю выборку. Теги и ингредиенты
+        идут в порядке id, как в api.serializers.RecipeListSerializer."""
+        return self.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('id')),
+            Prefetch(
+                'recipes_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient').order_by('id')
+            )
+        )
+
+    def with_user_flags(self, user):
+        """Добавляет к рецептам is_favorited и is_in_shopping_cart
+        в основном запросе вместо запроса на каждый рецепт."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, models.BooleanField()),
+                is_in_shopping_cart=Value(False, models.BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+    def limit_per_author(self, limit):
+        """Оставляет не более limit последних рецептов каждого автора.
+        Нумерация строк в окне по автору выполняется в одном запросе."""
+        ranked = self.order_by().annotate(
+            recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author_id'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        ).values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.extra(
+            where=[f'{self.model._meta.db_table}.id IN ('
+                   f'SELECT ranked.id FROM ({sql}) AS ranked '
+                   f'WHERE ranked.recipe_rank <= %s)'],
+            params=(*params, limit)
+        )
+
+
+class Recipe(CountersMixin, models.Model):
     '''
     Модель рецепта содержит поля ingregients, author, tags (связанные поля),
     image, name, text, cooking_time, pub_date.
     '''
+    counter_fields = ('favorites_count', 'shopping_cart_count')
     ingredients = models.ManyToManyField(
         Ingredient,
         verbose_name='Ингредиенты',
@@ -85,6 +139,11 @@ class Recipe(models.Model):
         verbose_name='Картинка',
         upload_to='recipes/'
     )
+    image_derivatives_ready = models.BooleanField(
+        verbose_name='Уменьшенные копии картинки готовы',
+        default=False,
+        editable=False
+    )
     name = models.CharField(
         verbose_name='Название',
         max_length=200
@@ -103,15 +162,39 @@ class Recipe(models.Model):
         auto_now=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Раз в избранном',
+        default=0,
+        editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='Раз в корзине',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx')
+        ]
 
     def __str__(self):
         return f'{self.name[:50]}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # имя картинки при загрузке: при её смене удаляются копии прежней.
+        image = dict(zip(field_names, values)).get('image')
+        instance.loaded_image = None if image is models.DEFERRED else image
+        return instance
+
 
 class RecipeIngredient(models.Model):
     '''
@@ -153,6 +236,126 @@ class RecipeIngredient(models.Model):
                 f' {self.amount}, {self.ingredient.measurement_unit}')
 
 
+class FeedEntry(models.Model):
+    '''
+    Запись ленты подписок: рецепт автора, на которого подписан user.
+    Ленты заполняет и обрезает модуль recipes.feed, pub_date повторяет
+    дату рецепта, чтобы страница ленты читалась по индексу без JOIN.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='feed_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='Этот рецепт уже есть в ленте.'
+            ),
+        )
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='feed_user_pub_date_idx'),
+            models.Index(fields=('user', 'author'),
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте у {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    '''
+    Заранее посчитанный похожий рецепт: score — коэффициент Жаккара
+    наборов ингредиентов. Таблицу строит модуль recipes.similarity.
+    '''
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='similar_recipes'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт',
+        related_name='+'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='Этот рецепт уже отмечен похожим.'
+            ),
+        )
+        indexes = [
+            models.Index(fields=('recipe', '-score'),
+                         name='similar_recipe_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class SearchDocumentField(models.TextField):
+    '''
+    Поисковый документ: в PostgreSQL — tsvector, в SQLite — строка
+    таблицы FTS5. Условие match и релевантность задаёт recipes.search.
+    '''
+
+
+class RecipeSearchDocument(models.Model):
+    '''
+    Поисковый документ рецепта. Таблицу создаёт и заполняет модуль
+    recipes.search, модель нужна, чтобы соединять её с рецептами.
+    '''
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        verbose_name='Рецепт',
+        related_name='search_document'
+    )
+    document = SearchDocumentField(
+        verbose_name='Документ'
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_search'
+        verbose_name = 'Поисковый документ'
+        verbose_name_plural = 'Поисковые документы'
+
+    def __str__(self):
+        return f'Документ {self.recipe_id}'
+
+
 class Favorite(models.Model):
     '''
     Модель избранных рецептов юзера содержит поля
@@ -215,3 +418,39 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.recipe} в корзине у {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    '''
+    Модель сводного списка покупок юзера содержит поля
+    user, ingredient (связанные поля), amount.
+    Поддерживается при изменении корзины и рецептов в ней.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list_items'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='Этот ингредиент уже есть в списке покупок.'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.amount} у {self.user}'
@@ -0,0 +1,212 @@
+import re
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Expression, F, FloatField, Lookup
+
+from recipes.models import (Recipe, RecipeIngredient, RecipeSearchDocument,
+                            SearchDocumentField)
+from recipes.tasks import in_commit_batch, on_commit_batch
+
+TABLE = RecipeSearchDocument._meta.db_table
+SEARCH_CONFIG = 'russian'
+BATCH_SIZE = 1000
+MAX_TERMS = 8
+WORD = re.compile(r'[^\W_]+')
+# веса полей документа: название, ингредиенты, описание.
+PG_DOCUMENT = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'C')"
+)
+# recipe_id не участвует в ранжировании.
+SQLITE_WEIGHTS = '0.0, 10.0, 4.0, 1.0'
+
+
+def is_supported(using=connection):
+    return using.vendor in ('postgresql', 'sqlite')
+
+
+def has_current_schema(using):
+    """Документ SQLite до соединения по recipe_id хранил id
+    только в rowid."""
+    if using.vendor == 'postgresql':
+        return True
+    with using.cursor() as cursor:
+        columns = using.introspection.get_table_description(cursor, TABLE)
+    return any(column.name == 'recipe_id' for column in columns)
+
+
+def ensure_schema(using=connection):
+    """Создаёт таблицу поискового документа, если её нет или она
+    устарела. Возвращает True, если таблица создана."""
+    if not is_supported(using):
+        return False
+    if TABLE in using.introspection.table_names():
+        if has_current_schema(using):
+            return False
+        with using.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {TABLE}')
+    recipe_table = Recipe._meta.db_table
+    with using.cursor() as cursor:
+        if using.vendor == 'postgresql':
+            cursor.execute(
+                f'CREATE TABLE {TABLE} ('
+                f'recipe_id integer PRIMARY KEY REFERENCES {recipe_table} '
+                f'(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+                f'document tsvector NOT NULL)'
+            )
+            cursor.execute(f'CREATE INDEX {TABLE}_document_idx '
+                           f'ON {TABLE} USING GIN (document)')
+        else:
+            # rowid совпадает с recipe_id: по нему удаляются документы.
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {TABLE} USING fts5('
+                f"recipe_id UNINDEXED, name, ingredients, text, "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+    return True
+
+
+def get_documents(recipe_ids):
+    """Возвращает поля документа для рецептов: (id, название,
+    названия ингредиентов, описание)."""
+    ingredients = defaultdict(list)
+    for recipe_id, name in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+            'recipe_id', 'ingredient__name').order_by('ingredient__name'):
+        ingredients[recipe_id].append(name)
+    return [
+        (pk, name, ' '.join(ingredients[pk]), text)
+        for pk, name, text in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', 'name', 'text')
+    ]
+
+
+def delete_recipes(recipe_ids):
+    if not recipe_ids or not is_supported():
+        return
+    column = 'recipe_id' if connection.vendor == 'postgresql' else 'rowid'
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE {column} '
+                       f'IN ({placeholders})', list(recipe_ids))
+
+
+@transaction.atomic
+def update_recipes(recipe_ids):
+    """Пересобирает поисковые документы рецептов."""
+    recipe_ids = list(set(recipe_ids))
+    if not recipe_ids or not is_supported():
+        return
+    documents = get_documents(recipe_ids)
+    delete_recipes(recipe_ids)
+    if not documents:
+        return
+    if connection.vendor == 'postgresql':
+        sql = (f'INSERT INTO {TABLE} (recipe_id, document) '
+               f'VALUES (%s, {PG_DOCUMENT})')
+    else:
+        sql = (f'INSERT INTO {TABLE} (rowid, recipe_id, name, ingredients, '
+               f'text) VALUES (%s, %s, %s, %s, %s)')
+        documents = [(pk, pk, *fields) for pk, *fields in documents]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, documents)
+
+
+def schedule_update(recipe_ids):
+    """Обновляет документы после фиксации транзакции, когда
+    ингредиенты рецепта уже сохранены. Рецепты, изменённые за
+    транзакцию, обновляются одним вызовом update_recipes."""
+    on_commit_batch(update_recipes, recipe_ids)
+
+
+def schedule_delete(recipe_id):
+    on_commit_batch(delete_recipes, (recipe_id,))
+
+
+def is_deleting(recipe_id):
+    """Удаляется ли документ рецепта в текущей транзакции."""
+    return in_commit_batch(delete_recipes, recipe_id)
+
+
+def rebuild():
+    """Пересобирает документы всех рецептов пачками."""
+    if not is_supported():
+        return 0
+    ids = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+        for start in range(0, len(ids), BATCH_SIZE):
+            update_recipes(ids[start:start + BATCH_SIZE])
+    return len(ids)
+
+
+def get_terms(query):
+    return WORD.findall(query.lower())[:MAX_TERMS]
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    """Документ соответствует запросу. В SQLite MATCH применяется
+    к самой таблице FTS5, поэтому берётся её псевдоним в запросе."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        if connection.vendor == 'postgresql':
+            lhs, params = compiler.compile(self.lhs)
+            return (f"{lhs} @@ to_tsquery('{SEARCH_CONFIG}', %s)",
+                    [*params, self.rhs])
+        return (f'{connection.ops.quote_name(self.lhs.alias)} MATCH %s',
+                [self.rhs])
+
+
+class SearchRank(Expression):
+    """Релевантность документа, найденного условием match в том же
+    запросе: чем больше, тем выше в выдаче."""
+    def __init__(self, document, query):
+        super().__init__(output_field=FloatField())
+        self.document = document
+        self.query = query
+
+    def get_source_expressions(self):
+        return [self.document]
+
+    def set_source_expressions(self, expressions):
+        self.document, = expressions
+
+    def as_sql(self, compiler, connection):
+        if connection.vendor == 'postgresql':
+            document, params = compiler.compile(self.document)
+            return (f"ts_rank({document}, "
+                    f"to_tsquery('{SEARCH_CONFIG}', %s))",
+                    [*params, self.query])
+        table = connection.ops.quote_name(self.document.alias)
+        return f'-bm25({table}, {SQLITE_WEIGHTS})', []
+
+
+def search(queryset, query):
+    """Оставляет рецепты, в названии, описании или ингредиентах которых
+    есть все слова запроса (слово можно не дописывать), и сортирует их
+    по релевантности. Таблица документов соединяется с рецептами один
+    раз, релевантность считается в той же строке. Она задаётся только
+    сортировкой, а не аннотацией: иначе COUNT оборачивается в GROUP BY,
+    где SQLite не разрешает bm25."""
+    terms = get_terms(query)
+    if not terms:
+        return queryset
+    if not is_supported():
+        for term in terms:
+            queryset = queryset.filter(name__icontains=term)
+        return queryset
+    if connection.vendor == 'postgresql':
+        expression = ' & '.join(f'{term}:*' for term in terms)
+    else:
+        expression = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.filter(
+        search_document__document__match=expression
+    ).order_by(
+        SearchRank(F('search_document__document'), expression).desc(),
+        '-pub_date', '-id'
+    )
@@ -0,0 +1,125 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Sum
+from django.dispatch import Signal
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+# списки покупок изменились, аргумент user_ids; None — списки всех.
+shopping_lists_changed = Signal()
+
+
+def get_amounts(recipe):
+    """Возвращает словарь {id ингредиента: количество} для рецепта."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe=recipe).values_list('ingredient_id', 'amount'))
+
+
+@transaction.atomic
+def apply_delta(user_ids, delta):
+    """Изменяет списки покупок пользователей на delta
+    {id ингредиента: изменение количества}. Позиции с нулевым
+    количеством удаляются.
+
+    Недостающие позиции сначала вставляются с нулевым количеством
+    одним INSERT, пропускающим уже существующие: параллельная
+    транзакция, создавшая ту же позицию, не приводит к ошибке
+    уникальности, а её строка затем блокируется и изменяется
+    вместе с остальными."""
+    delta = {key: value for key, value in delta.items() if value}
+    if not user_ids or not delta:
+        return
+    ShoppingListItem.objects.bulk_create((
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=0)
+        for user_id in user_ids
+        for ingredient_id, amount in delta.items() if amount > 0
+    ), ignore_conflicts=True)
+    items = ShoppingListItem.objects.select_for_update().filter(
+        user_id__in=user_ids, ingredient_id__in=delta)
+    changed, removed = [], []
+    for item in items:
+        item.amount += delta[item.ingredient_id]
+        if item.amount > 0:
+            changed.append(item)
+        else:
+            removed.append(item.pk)
+    ShoppingListItem.objects.bulk_update(changed, ('amount',))
+    if removed:
+        ShoppingListItem.objects.filter(pk__in=removed).delete()
+    shopping_lists_changed.send(sender=ShoppingListItem,
+                                user_ids=list(user_ids))
+
+
+def add_recipe(user, recipe):
+    """Добавляет ингредиенты рецепта в список покупок пользователя."""
+    apply_delta((user.id,), get_amounts(recipe))
+
+
+def remove_recipe(user, recipe):
+    """Вычитает ингредиенты рецепта из списка покупок пользователя."""
+    apply_delta((user.id,), {
+        ingredient: -amount
+        for ingredient, amount in get_amounts(recipe).items()
+    })
+
+
+def get_total_amounts(recipe_ids):
+    """Возвращает суммарные количества ингредиентов нескольких рецептов."""
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values('ingredient_id').annotate(
+        total_amount=Sum('amount')
+    ).order_by().values_list('ingredient_id', 'total_amount'))
+
+
+def add_recipes(user, recipe_ids):
+    """Добавляет в список покупок ингредиенты сразу нескольких рецептов."""
+    if recipe_ids:
+        apply_delta((user.id,), get_total_amounts(recipe_ids))
+
+
+def remove_recipes(user, recipe_ids):
+    """Вычитает из списка покупок ингредиенты нескольких рецептов."""
+    if recipe_ids:
+        apply_delta((user.id,), {
+            ingredient: -amount
+            for ingredient, amount in get_total_amounts(recipe_ids).items()
+        })
+
+
+def change_recipe(recipe, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки покупок всех
+    пользователей, у которых рецепт лежит в корзине."""
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    if not any(delta.values()):
+        return
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe=recipe).values_list('user_id', flat=True))
+    apply_delta(user_ids, delta)
+
+
+@transaction.atomic
+def rebuild(users=None):
+    """Пересчитывает списки покупок по корзинам с нуля."""
+    items = ShoppingListItem.objects.all()
+    carts = ShoppingCart.objects.all()
+    if users is not None:
+        items = items.filter(user__in=users)
+        carts = carts.filter(user__in=users)
+    items.delete()
+    rows = carts.values(
+        'user', 'recipe__recipes_ingredient__ingredient'
+    ).annotate(
+        total_amount=Sum('recipe__recipes_ingredient__amount')
+    ).order_by()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=row['user'],
+                         ingredient_id=row[
+                             'recipe__recipes_ingredient__ingredient'],
+                         amount=row['total_amount'])
+        for row in rows.iterator() if row['total_amount']
+    )
+    shopping_lists_changed.send(sender=ShoppingListItem, user_ids=None)
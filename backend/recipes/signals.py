@@ -0,0 +1,121 @@
+from django.db import connections
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes import counters, feed, search, shopping_list, similarity
+from recipes.images import delete_derivatives, generate_derivatives
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart)
+from recipes.tasks import run_in_background
+from users.models import Follow
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    """Удаляемый рецепт исчезает из корзин каскадно,
+    поэтому его ингредиенты вычитаются из списков покупок."""
+    shopping_list.change_recipe(
+        instance, shopping_list.get_amounts(instance), {})
+
+
+@receiver(pre_save, sender=Recipe)
+def schedule_old_derivatives_delete(sender, instance, **kwargs):
+    """При смене картинки загруженного рецепта копии прежней удаляются
+    в фоновом потоке."""
+    old_name = getattr(instance, 'loaded_image', None)
+    if old_name and old_name != instance.image.name:
+        run_in_background(delete_derivatives, old_name)
+        instance.loaded_image = None
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_derivatives(sender, instance, **kwargs):
+    """Уменьшенные копии новой картинки создаются в фоновом потоке."""
+    if instance.image and not instance.image_derivatives_ready:
+        run_in_background(generate_derivatives, instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def increment_counter(sender, instance, created, **kwargs):
+    if created and not counters.is_suspended():
+        model, field, relation = counters.SOURCES[sender]
+        counters.change(model, getattr(instance, relation), field, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def decrement_counter(sender, instance, **kwargs):
+    """Срабатывает и при каскадном удалении. Если удаляется сама
+    строка со счётчиком, UPDATE просто ничего не изменит."""
+    if counters.is_suspended():
+        return
+    model, field, relation = counters.SOURCES[sender]
+    counters.change(model, getattr(instance, relation), field, -1)
+
+
+def create_search_table(sender, using, **kwargs):
+    """Создаёт таблицу полнотекстового поиска после migrate
+    и заполняет её, если рецепты уже есть."""
+    if search.ensure_schema(connections[using]):
+        search.rebuild()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def update_search_document(sender, instance, **kwargs):
+    """Ингредиенты удаляемого рецепта удаляются каскадом,
+    его документ удаляет delete_search_document."""
+    recipe_id = instance.pk if sender is Recipe else instance.recipe_id
+    if not search.is_deleting(recipe_id):
+        search.schedule_update((recipe_id,))
+
+
+@receiver(pre_delete, sender=Recipe)
+def delete_search_document(sender, instance, **kwargs):
+    search.schedule_delete(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def update_ingredient_recipes(sender, instance, created=False, **kwargs):
+    """Название ингредиента входит в документы рецептов с ним."""
+    if not created:
+        search.schedule_update(RecipeIngredient.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_fanout(sender, instance, created, **kwargs):
+    """Новый рецепт попадает в ленты подписчиков автора в фоновом
+    потоке, у изменённого там же обновляется дата."""
+    if created:
+        run_in_background(feed.fanout, instance.pk)
+    else:
+        run_in_background(feed.move_recipe, instance.pk)
+
+
+@receiver(post_save, sender=Follow)
+def schedule_feed_backfill(sender, instance, created, **kwargs):
+    if created:
+        run_in_background(feed.backfill, instance.user_id,
+                          instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(sender, instance, **kwargs):
+    feed.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def schedule_similar_refresh(sender, instance, **kwargs):
+    """Записи об удаляемом рецепте исчезают каскадно, поэтому рецепты,
+    у которых он был похожим, получают новых соседей."""
+    recipe_ids = similarity.get_lister_ids(instance.pk)
+    if recipe_ids:
+        run_in_background(similarity.refresh, recipe_ids)
@@ -0,0 +1,234 @@
+from collections import defaultdict
+from itertools import combinations
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+
+from recipes.importer import iter_batches
+from recipes.models import RecipeIngredient, SimilarRecipe
+from recipes.tasks import run_in_background
+
+NEIGHBORS = 10
+# MinHash: NUM_HASHES функций вида (a * x + b) mod PRIME.
+NUM_HASHES = 64
+# LSH: подпись режется на BANDS полос по NUM_HASHES // BANDS значений;
+# рецепты с совпавшей полосой — кандидаты. Порог сходства около
+# (1 / BANDS) ** (BANDS / NUM_HASHES), при 32 полосах — 0.18.
+BANDS = 32
+PRIME = 2 ** 31 - 1
+SEED = 42
+# слишком большие корзины полос (общие популярные ингредиенты)
+# не дают кандидатов, чтобы не сравнивать их рецепты попарно.
+MAX_BUCKET = 200
+BATCH_SIZE = 1000
+# ингредиент, который есть в большем числе рецептов, не даёт кандидатов
+# при обновлении: иначе обратный индекс загружал бы почти весь каталог.
+MAX_POSTINGS = 1000
+
+
+def get_ingredient_sets(recipe_ids=None):
+    """Наборы ингредиентов рецептов: {id рецепта: frozenset id}."""
+    rows = RecipeIngredient.objects.order_by()
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    sets = defaultdict(set)
+    for recipe_id, ingredient_id in rows.values_list(
+            'recipe_id', 'ingredient_id'):
+        sets[recipe_id].add(ingredient_id)
+    return {recipe_id: frozenset(items) for recipe_id, items in sets.items()}
+
+
+def get_signatures(sets):
+    """MinHash-подписи непустых наборов: строка матрицы — минимумы
+    NUM_HASHES хеш-функций по ингредиентам рецепта."""
+    generator = np.random.RandomState(SEED)
+    a = generator.randint(1, PRIME, NUM_HASHES).astype(np.int64)
+    b = generator.randint(0, PRIME, NUM_HASHES).astype(np.int64)
+    signatures = []
+    for start in range(0, len(sets), BATCH_SIZE):
+        batch = sets[start:start + BATCH_SIZE]
+        values = np.fromiter((item for items in batch for item in items),
+                             np.int64) % PRIME
+        offsets = np.cumsum([0] + [len(items) for items in batch[:-1]])
+        hashes = (np.outer(a, values) + b[:, None]) % PRIME
+        signatures.append(np.minimum.reduceat(hashes, offsets, axis=1).T)
+    return np.vstack(signatures)
+
+
+def get_candidates(signatures):
+    """Пары кандидатов LSH: номера строк подписей, у которых
+    совпала хотя бы одна полоса."""
+    rows = NUM_HASHES // BANDS
+    candidates = defaultdict(set)
+    for band in range(BANDS):
+        _, buckets = np.unique(signatures[:, band * rows:(band + 1) * rows],
+                               axis=0, return_inverse=True)
+        buckets = buckets.ravel()
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for group in np.split(order, bounds):
+            if 1 < len(group) <= MAX_BUCKET:
+                for first, second in combinations(group.tolist(), 2):
+                    candidates[first].add(second)
+                    candidates[second].add(first)
+    return candidates
+
+
+def get_top(recipe_ids, scores):
+    """NEIGHBORS лучших соседей по убыванию сходства, при равенстве —
+    по id рецепта."""
+    recipe_ids, scores = np.asarray(recipe_ids), np.asarray(scores)
+    order = np.lexsort((recipe_ids, -scores))[:NEIGHBORS]
+    return list(zip(recipe_ids[order].tolist(), scores[order].tolist()))
+
+
+class InvertedIndex:
+    """Обратный индекс ингредиент → рецепты и размеры наборов.
+    Точные соседи рецепта считаются по рецептам с общими ингредиентами,
+    без перебора всего каталога."""
+    def __init__(self, pairs):
+        postings = defaultdict(list)
+        sizes = defaultdict(int)
+        for recipe_id, ingredient_id in pairs:
+            postings[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+        self.postings = {ingredient_id: np.array(recipe_ids, np.int64)
+                         for ingredient_id, recipe_ids in postings.items()}
+        self.sizes = sizes
+
+    @classmethod
+    def for_recipes(cls, sets):
+        """Индекс рецептов с общими редкими ингредиентами (не более чем
+        в MAX_POSTINGS рецептах). В индекс попадают все ингредиенты
+        кандидатов, поэтому их сходство точное; соседи только по частым
+        ингредиентам теряются. Рецепта без редких ингредиентов в таком
+        индексе нет: его кандидаты — MAX_POSTINGS последних рецептов
+        с самым редким из его ингредиентов."""
+        items = {item for items in sets.values() for item in items}
+        rare = RecipeIngredient.objects.filter(
+            ingredient_id__in=items).order_by().values(
+            'ingredient_id').annotate(recipes=Count('id')).filter(
+            recipes__lte=MAX_POSTINGS).values('ingredient_id')
+        condition = Q(recipe_id__in=RecipeIngredient.objects.filter(
+            ingredient_id__in=rare).values('recipe_id'))
+        pairs = list(RecipeIngredient.objects.filter(condition).order_by(
+        ).values_list('recipe_id', 'ingredient_id'))
+        found = {recipe_id for recipe_id, _ in pairs}
+        common = [items for recipe_id, items in sets.items()
+                  if items and recipe_id not in found]
+        if not common:
+            return cls(pairs)
+        frequency = dict(RecipeIngredient.objects.filter(
+            ingredient_id__in={item for items in common for item in items}
+        ).order_by().values('ingredient_id').annotate(
+            recipes=Count('id')).values_list('ingredient_id', 'recipes'))
+        for items in common:
+            condition |= Q(recipe_id__in=RecipeIngredient.objects.filter(
+                ingredient_id=min(items, key=frequency.get)
+            ).order_by('-recipe_id').values('recipe_id')[:MAX_POSTINGS])
+        return cls(RecipeIngredient.objects.filter(condition).order_by(
+        ).values_list('recipe_id', 'ingredient_id'))
+
+    def get_neighbors(self, recipe_id, ingredients):
+        postings = [self.postings[item] for item in ingredients
+                    if item in self.postings]
+        if not postings:
+            return []
+        recipe_ids, shared = np.unique(np.concatenate(postings),
+                                       return_counts=True)
+        other = recipe_ids != recipe_id
+        recipe_ids, shared = recipe_ids[other], shared[other]
+        sizes = np.fromiter((self.sizes[pk] for pk in recipe_ids.tolist()),
+                            np.int64, len(recipe_ids))
+        return get_top(recipe_ids,
+                       shared / (len(ingredients) + sizes - shared))
+
+
+def get_jaccard(first, second):
+    return len(first & second) / len(first | second)
+
+
+def save_neighbors(neighbors):
+    """Заменяет соседей рецептов {id: [(id соседа, сходство)]}."""
+    SimilarRecipe.objects.filter(recipe_id__in=list(neighbors)).delete()
+    rows = (SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, items in neighbors.items()
+            for similar_id, score in items)
+    for batch in iter_batches(rows, BATCH_SIZE):
+        SimilarRecipe.objects.bulk_create(batch)
+
+
+@transaction.atomic
+def rebuild():
+    """Пересчитывает соседей всех рецептов. Кандидаты ищутся через
+    MinHash/LSH, сходство кандидатов считается точно. Рецептам, у которых
+    кандидатов меньше NEIGHBORS, соседи ищутся по обратному индексу."""
+    sets = get_ingredient_sets()
+    recipe_ids = sorted(sets)
+    SimilarRecipe.objects.all().delete()
+    if not recipe_ids:
+        return 0
+    rows = [sets[recipe_id] for recipe_id in recipe_ids]
+    candidates = get_candidates(get_signatures(rows))
+    index = InvertedIndex(
+        (recipe_id, item) for recipe_id in recipe_ids
+        for item in sets[recipe_id])
+    neighbors = {}
+    for number, recipe_id in enumerate(recipe_ids):
+        found = candidates.get(number, ())
+        if len(found) < NEIGHBORS:
+            neighbors[recipe_id] = index.get_neighbors(
+                recipe_id, sets[recipe_id])
+            continue
+        others = [recipe_ids[other] for other in found]
+        neighbors[recipe_id] = get_top(others, [
+            get_jaccard(rows[number], sets[other]) for other in others])
+    save_neighbors(neighbors)
+    return len(recipe_ids)
+
+
+def compute_neighbors(recipe_ids):
+    """Точные соседи рецептов по обратному индексу их ингредиентов."""
+    sets = get_ingredient_sets(recipe_ids)
+    index = InvertedIndex.for_recipes(sets)
+    return {recipe_id: index.get_neighbors(recipe_id, sets.get(recipe_id, ()))
+            for recipe_id in recipe_ids}
+
+
+@transaction.atomic
+def update_recipes(recipe_ids):
+    """Обновляет соседей рецептов после изменения их ингредиентов,
+    а также рецептов, у которых они были или стали соседями."""
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    neighbors = compute_neighbors(recipe_ids)
+    affected = set(SimilarRecipe.objects.filter(
+        similar_id__in=recipe_ids).values_list('recipe_id', flat=True))
+    affected.update(similar_id for items in neighbors.values()
+                    for similar_id, _ in items)
+    affected -= recipe_ids
+    if affected:
+        neighbors.update(compute_neighbors(affected))
+    save_neighbors(neighbors)
+
+
+def schedule_update(recipe_id):
+    """Пересчитывает соседей в фоновом потоке после фиксации транзакции,
+    когда ингредиенты рецепта уже сохранены. Вызывается при создании
+    рецепта и при изменении набора его ингредиентов."""
+    run_in_background(update_recipes, (recipe_id,))
+
+
+@transaction.atomic
+def refresh(recipe_ids):
+    """Пересчитывает соседей только указанных рецептов."""
+    save_neighbors(compute_neighbors(set(recipe_ids)))
+
+
+def get_lister_ids(recipe_id):
+    """Рецепты, у которых recipe_id среди похожих."""
+    return list(SimilarRecipe.objects.filter(
+        similar_id=recipe_id).values_list('recipe_id', flat=True))
@@ -0,0 +1,122 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+_deferred = threading.local()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.BACKGROUND_WORKERS,
+                    thread_name_prefix='foodgram-background'
+                )
+    return _executor
+
+
+def _run(func, args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args):
+    """Выполняет func в пуле фоновых потоков после фиксации текущей
+    транзакции, чтобы задача видела сохранённые данные.
+    При BACKGROUND_WORKERS = 0 задача выполняется в текущем потоке,
+    внутри defer_tasks — откладывается."""
+    tasks = getattr(_deferred, 'tasks', None)
+    if tasks is not None:
+        transaction.on_commit(lambda: tasks.append((func, args)))
+    elif settings.BACKGROUND_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(_run, func, args))
+    else:
+        transaction.on_commit(lambda: func(*args))
+
+
+@contextmanager
+def defer_tasks():
+    """Фоновые задачи, поставленные в блоке, не запускаются, а после
+    фиксации транзакции попадают в список (func, args), который
+    возвращает блок. Так замер запроса не включает фоновую работу."""
+    previous = getattr(_deferred, 'tasks', None)
+    _deferred.tasks = []
+    try:
+        yield _deferred.tasks
+    finally:
+        _deferred.tasks = previous
+
+
+def run_tasks(tasks):
+    """Выполняет отложенные задачи в текущем потоке."""
+    for func, args in tasks:
+        func(*args)
+
+
+class CommitBatch(set):
+    """Значения, накопленные за транзакцию для одного вызова func
+    после её фиксации."""
+    def __init__(self, connection, func):
+        super().__init__()
+        self.connection = connection
+        self.func = func
+
+    def __call__(self):
+        if self.connection.commit_batches.get(self.func) is self:
+            del self.connection.commit_batches[self.func]
+        self.func(set(self))
+
+    def is_pending(self):
+        # после отката транзакции или точки сохранения Django
+        # забывает её обработчики on_commit вместе с этим.
+        return any(callback is self
+                   for _, callback in self.connection.run_on_commit)
+
+
+def get_commit_batch(connection, func):
+    batches = connection.__dict__.setdefault('commit_batches', {})
+    batch = batches.get(func)
+    if batch is None or not batch.is_pending():
+        batch = batches[func] = CommitBatch(connection, func)
+        connection.on_commit(batch)
+    return batch
+
+
+def on_commit_batch(func, items, using=None):
+    """Передаёт items в func после фиксации текущей транзакции: всё,
+    что накоплено за транзакцию, уходит одним вызовом func(set).
+    Вне транзакции func вызывается сразу. Значения из откатанной точки
+    сохранения могут остаться в пачке, поэтому func должна только
+    приводить данные в соответствие с базой."""
+    items = set(items)
+    if not items:
+        return
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        func(items)
+        return
+    get_commit_batch(connection, func).update(items)
+
+
+def in_commit_batch(func, item, using=None):
+    """Ждёт ли item вызова func после фиксации текущей транзакции."""
+    connection = transaction.get_connection(using)
+    batch = getattr(connection, 'commit_batches', {}).get(func)
+    return batch is not None and batch.is_pending() and item in batch
@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from recipes.importer import import_file
+from recipes.models import Ingredient
+
+
+class ImportFileTests(TestCase):
+    def write_file(self, content, suffix):
+        descriptor, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.remove, path)
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_malformed_json_line_is_invalid(self):
+        path = self.write_file(
+            '{"name": "соль", "measurement_unit": "г"}\n'
+            '{"name": "перец", \n'
+            '\n'
+            '{"name": "сахар", "measurement_unit": "г"}\n',
+            '.jsonl')
+        stats = import_file('ingredients', path, batch_size=2)
+        self.assertEqual((stats.rows, stats.created, stats.invalid),
+                         (3, 2, 1))
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['сахар', 'соль'])
@@ -0,0 +1,53 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from recipes import similarity
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from users.models import User
+
+
+class InvertedIndexTests(TestCase):
+    """Частые ингредиенты не тянут в индекс рецепты, с которыми
+    у рецепта нет редких общих ингредиентов."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Имя', last_name='Фамилия', password='password')
+        salt, pepper, *others = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)
+        ]
+        cls.first = cls.create_recipe((salt, pepper))
+        cls.second = cls.create_recipe((salt, pepper))
+        cls.others = [cls.create_recipe((salt, other)) for other in others]
+        cls.plain = cls.create_recipe((salt,))
+
+    @classmethod
+    def create_recipe(cls, ingredients):
+        recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            image='recipes/test.png', image_derivatives_ready=True,
+            cooking_time=10)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        return recipe
+
+    @mock.patch.object(similarity, 'MAX_POSTINGS', 3)
+    def test_common_ingredient_gives_no_candidates(self):
+        sets = similarity.get_ingredient_sets([self.first.pk])
+        index = similarity.InvertedIndex.for_recipes(sets)
+        self.assertEqual(set(index.sizes), {self.first.pk, self.second.pk})
+        self.assertEqual(
+            similarity.compute_neighbors([self.first.pk]),
+            {self.first.pk: [(self.second.pk, 1.0)]})
+
+    @mock.patch.object(similarity, 'MAX_POSTINGS', 3)
+    def test_only_common_ingredients_use_latest_recipes(self):
+        sets = similarity.get_ingredient_sets([self.plain.pk])
+        index = similarity.InvertedIndex.for_recipes(sets)
+        self.assertEqual(set(index.sizes),
+                         {self.plain.pk, *[r.pk for r in self.others[-2:]]})
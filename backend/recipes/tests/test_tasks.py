@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+
+from recipes.tasks import (defer_tasks, in_commit_batch, on_commit_batch,
+                           run_in_background, run_tasks)
+
+
+class CommitBatchTests(TransactionTestCase):
+    def setUp(self):
+        self.calls = []
+
+    def record(self, items):
+        self.calls.append(items)
+
+    def test_one_call_per_transaction(self):
+        with transaction.atomic():
+            on_commit_batch(self.record, (1, 2))
+            with transaction.atomic():
+                on_commit_batch(self.record, (2, 3))
+            self.assertTrue(in_commit_batch(self.record, 3))
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [{1, 2, 3}])
+        self.assertFalse(in_commit_batch(self.record, 3))
+
+    def test_outside_transaction_runs_immediately(self):
+        on_commit_batch(self.record, (1,))
+        on_commit_batch(self.record, ())
+        self.assertEqual(self.calls, [{1}])
+
+    def test_rolled_back_items_are_dropped(self):
+        with transaction.atomic():
+            on_commit_batch(self.record, (1,))
+            try:
+                with transaction.atomic():
+                    on_commit_batch(self.record, (2,))
+                    raise ValueError
+            except ValueError:
+                pass
+        # значения откатанной точки сохранения могут остаться в пачке.
+        self.assertEqual(len(self.calls), 1)
+        self.assertIn(1, self.calls[0])
+        self.calls.clear()
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    on_commit_batch(self.record, (3,))
+                    raise ValueError
+            except ValueError:
+                pass
+            on_commit_batch(self.record, (4,))
+        self.assertEqual(self.calls, [{4}])
+
+
+@override_settings(BACKGROUND_WORKERS=0)
+class DeferTasksTests(TransactionTestCase):
+    def test_tasks_run_only_when_requested(self):
+        calls = []
+        with defer_tasks() as tasks:
+            with transaction.atomic():
+                run_in_background(calls.append, 1)
+                self.assertEqual(tasks, [])
+            self.assertEqual(calls, [])
+        run_in_background(calls.append, 2)
+        self.assertEqual(calls, [2])
+        run_tasks(tasks)
+        self.assertEqual(calls, [2, 1])
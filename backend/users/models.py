@@ -1,10 +1,58 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.db import models
 
+from .signals import users_updated
 
-class User(AbstractUser):
+
+class CountersMixin:
+    '''
+    Денормализованные счётчики counter_fields меняются только через
+    UPDATE с F() (recipes.counters). Обычное сохранение загруженного
+    объекта их не записывает, чтобы не затереть параллельные изменения
+    прочитанным ранее значением.
+    '''
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        '''
+        UPDATE без save() не отправляет post_save, поэтому об изменённых
+        пользователях сообщает сигнал users_updated. Счётчики меняются
+        так постоянно и сигнала не требуют.
+        '''
+        if set(kwargs) <= set(self.model.counter_fields):
+            return super().update(**kwargs)
+        pks = list(self.values_list('pk', flat=True))
+        rows = super().update(**kwargs)
+        if pks:
+            users_updated.send(sender=self.model, pks=pks, fields=set(kwargs))
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
+
+
+class User(CountersMixin, AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
+    counter_fields = ('recipes_count', 'followers_count')
+    objects = UserManager()
     email = models.EmailField(
         verbose_name='Электронная почта',
         unique=True,
@@ -18,6 +66,16 @@ class User(AbstractUser):
         verbose_name='Фамилия',
         max_length=150,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
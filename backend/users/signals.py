@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# UPDATE пользователей через QuerySet.update, в обход save():
+# аргументы pks (id изменённых) и fields (изменённые поля).
+users_updated = Signal()